@@ -4,14 +4,24 @@ import geometry
 import events
 
 class Actor:
-    MAX_VELOCITY = geometry.Vector(640.0, 360.0)
+    """
+    Physics state of one thing on screen. Units are pixels and seconds,
+    update(dt) advances the state by dt seconds.
 
-    def __init__(self, state = geometry.State(), is_player = False):
-        self.state = state
+    """
+    MAX_VELOCITY = geometry.Vector(76800.0, 43200.0)
+
+    def __init__(self, state = None, is_player = False):
+        self.state = state if state is not None else geometry.State()
         self.bounciness = 0
         self.is_player = is_player
         self.color = "white"
         self.bmin = self.bmax = geometry.Vector(0,0)
+        # Position before the last update, rendering interpolates from it
+        self.previous_position = geometry.Vector(0,0)
+        # Set when the actor's physics are stepped by an npc_world.NpcWorld
+        self.world = None
+        self.world_index = None
 
     # Define properties
 
@@ -61,30 +71,50 @@ class Actor:
 
     # Methods 
 
-    def update(self):
-        self.state.velocity += self.state.acceleration
-        new_position = self.state.position + self.state.velocity
+    def update(self, dt):
+        """ Integrate the state in place, this runs for every actor every tick """
+        state = self.state
+        position = state.position
+        velocity = state.velocity
+        bmin = self.bmin
+        self.previous_position.set_from(position)
+
+        velocity.add_scaled(state.acceleration, dt)
+        new_x = position.x + velocity.x * dt
+        new_y = position.y + velocity.y * dt
 
         # Correct bounds for actor size
-        bounds_max = self.bmax - self.size
+        max_x = self.bmax.x - self.size.x
+        max_y = self.bmax.y - self.size.y
 
         # Bounciness behaviour
-        if new_position.x > bounds_max.x or new_position.x < self.bmin.x:
-            self.state.velocity.x = -self.state.velocity.x * self.bounciness
-        if new_position.y > bounds_max.y or new_position.y < self.bmin.y:
-            self.state.velocity.y = -self.state.velocity.y * self.bounciness
+        if new_x > max_x or new_x < bmin.x:
+            velocity.x = -velocity.x * self.bounciness
+        if new_y > max_y or new_y < bmin.y:
+            velocity.y = -velocity.y * self.bounciness
 
         # Bound the position
-        new_position.x = max(min(new_position.x, bounds_max.x), self.bmin.x)
-        new_position.y = max(min(new_position.y, bounds_max.y), self.bmin.y)
-
-        self.state.position = new_position
-
-    def add_velocity(self, velocity):
-        new_velocity = self.state.velocity + velocity
-
-        self.state.velocity.x = min(new_velocity.x, self.MAX_VELOCITY.x)
-        self.state.velocity.y = min(new_velocity.y, self.MAX_VELOCITY.y)
+        position.x = max(min(new_x, max_x), bmin.x)
+        position.y = max(min(new_y, max_y), bmin.y)
+
+    def add_velocity(self, velocity, scale = 1):
+        state_velocity = self.state.velocity
+        state_velocity.x = min(state_velocity.x + velocity.x * scale, self.MAX_VELOCITY.x)
+        state_velocity.y = min(state_velocity.y + velocity.y * scale, self.MAX_VELOCITY.y)
+
+    def clamp_to_bounds(self):
+        """ Move the actor inside its bounds without bouncing it """
+        position = self.state.position
+        position.x = max(min(position.x, self.bmax.x - self.size.x), self.bmin.x)
+        position.y = max(min(position.y, self.bmax.y - self.size.y), self.bmin.y)
+        self.previous_position.set_from(position)
+
+    def interpolated_position(self, alpha):
+        """ Where to draw the actor alpha of the way into the next tick """
+        previous = self.previous_position
+        position = self.state.position
+        return (previous.x + (position.x - previous.x) * alpha,
+                previous.y + (position.y - previous.y) * alpha)
 
     def bounding_box(self):
         return geometry.Rectangle(self.state.position, self.size)
@@ -102,31 +132,66 @@ class PlayerSeal(Actor):
                 is_player = True)
         self.size = geometry.Vector(50, 50)
         self.bounciness = 0.4
-        self.state.acceleration = geometry.Vector(0, -0.05)
+        # Pixels per second squared
+        self.state.acceleration = geometry.Vector(0, -720)
         self.state.velocity = geometry.Vector(0,0)
-        self.delta_velocity = geometry.Vector(0, 0.15)
+        # Acceleration while swimming, on top of the state's
+        self.thrust = geometry.Vector(0, 2160)
         self.delete = False
+        self.previous_position.set_from(self.state.position)
 
-    def add_velocity(self):
-        super().add_velocity(self.delta_velocity)
+    def add_velocity(self, dt):
+        """ Swim for dt seconds """
+        super().add_velocity(self.thrust, dt)
 
-    def update(self):
-        super().update()
+    def update(self, dt):
+        super().update(dt)
 
 
 class NpcFish(Actor):
-    """ It's a fish! """
+    """
+    It's a fish! Npcs only ever swim horizontally, so once they are inside
+    their bounds only x is integrated.
+
+    """
     def __init__(self, state, size):
         super().__init__(state)
         self.delete = False
         self.size = size
+        # Despawn as soon as the right edge is left of this
+        self.despawn_x = 0
+
+    def reset(self):
+        """ Get a pooled npc ready to spawn again """
+        self.state.position.set(0, 0)
+        self.previous_position.set(0, 0)
+        self.state.velocity.set(0, 0)
+        self.state.acceleration.set(0, 0)
+        self.delete = False
 
-    def update(self):
+    def update(self, dt):
         """ Destructive event checking """
-        super().update()
-
-        # Delete if we've hit the edge
-        if self.state.position.x <= self.bmin.x:
+        if self.world is not None:
+            # The world has already stepped us, just copy our row back
+            self.world.read_back(self)
+            return
+
+        # The x half of Actor.update
+        state = self.state
+        position = state.position
+        velocity = state.velocity
+        bmin_x = self.bmin.x
+        self.previous_position.x = position.x
+
+        velocity.x += state.acceleration.x * dt
+        new_x = position.x + velocity.x * dt
+        max_x = self.bmax.x - self.size.x
+        if new_x > max_x or new_x < bmin_x:
+            velocity.x = -velocity.x * self.bounciness
+        position.x = max(min(new_x, max_x), bmin_x)
+
+        # Delete once we're off screen or have hit the edge
+        if position.x + self.size.x <= self.despawn_x or position.x <= bmin_x:
             self.delete = True
 
 
@@ -0,0 +1,214 @@
+#!/bin/env python3
+"""
+Build step that packs the scaled sprite images into one atlas per screen size.
+
+Every entry of assets/game_assets.json with a "scale" is a sprite. Its image
+and animation frames are scaled for the current screen size and packed into
+a single image, together with every other sprite. The atlas and an index of
+where each image sits in it are cached on disk, named after a hash of the
+source images, their scales and the screen size, so they are only rebuilt
+when one of those changes. Loading the atlas is one PNG decode and no
+rescaling, and each sprite image is a subsurface of it.
+
+The atlas is built on first run if it isn't cached yet, or ahead of time:
+
+    python atlas.py
+    python atlas.py --size 800 520
+
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+
+import pygame
+
+import config
+
+VERSION = 1
+# Transparent pixels between packed images
+PADDING = 1
+
+
+def sprite_scale(asset_object, screen_size = None):
+    """ Scale of a sprite entry of the asset list at the given screen size """
+    height = (screen_size or config.ScreenInfo.size)[1]
+    return asset_object.get("scale", 1) * (height / float(config.ScreenInfo.reference_height))
+
+
+def sprite_images(manifest, screen_size = None):
+    """ (path, scale) of every image that goes into the atlas """
+    images = []
+    for name in sorted(manifest):
+        asset_object = manifest[name]
+        if "sprite" not in asset_object or "scale" not in asset_object:
+            continue
+        scale = sprite_scale(asset_object, screen_size)
+        directory = asset_object["directory"]
+        images.append((os.path.join(directory, asset_object["sprite"]), scale))
+        for frames in asset_object.get("animations", dict()).values():
+            images.extend((os.path.join(directory, x), scale) for x in frames)
+    return images
+
+
+def content_hash(images, screen_size):
+    digest = hashlib.sha1()
+    digest.update(("%d %dx%d" % ((VERSION,) + tuple(screen_size))).encode())
+    for path, scale in images:
+        digest.update(("%s %r" % (path, scale)).encode())
+        with open(path, "rb") as image_file:
+            digest.update(hashlib.sha1(image_file.read()).digest())
+    return digest.hexdigest()[:16]
+
+
+def pack(sizes):
+    """
+    Shelf packing, tallest images first. Returns the atlas size and the
+    position of each size, in the order given.
+
+    """
+    total_area = sum((w + PADDING) * (h + PADDING) for w, h in sizes)
+    row_width = max([int(total_area ** 0.5)] + [w + PADDING for w, h in sizes])
+
+    positions = [None] * len(sizes)
+    x = y = shelf_height = width = 0
+    for i in sorted(range(len(sizes)), key=lambda i: -sizes[i][1]):
+        w, h = sizes[i]
+        if x and x + w > row_width:
+            y += shelf_height + PADDING
+            x = shelf_height = 0
+        positions[i] = (x, y)
+        x += w + PADDING
+        width = max(width, x)
+        shelf_height = max(shelf_height, h)
+    return (max(1, width), max(1, y + shelf_height)), positions
+
+
+class SpriteAtlas:
+    """ One packed surface plus the rect of every image in it """
+    def __init__(self, surface, rects):
+        self.surface = surface
+        # (path, scale) -> pygame.Rect
+        self.rects = rects
+        self.subsurfaces = dict()
+
+    def __len__(self):
+        return len(self.rects)
+
+    def image(self, path, scale):
+        """ Subsurface for path at scale, None if it isn't in the atlas """
+        key = (path, scale)
+        image = self.subsurfaces.get(key)
+        if image is None:
+            rect = self.rects.get(key)
+            if rect is None:
+                return None
+            image = self.subsurfaces[key] = self.surface.subsurface(rect)
+        return image
+
+    @classmethod
+    def build(cls, images):
+        """ Scale and pack the images, the surface isn't converted """
+        scaled = []
+        for path, scale in images:
+            img = pygame.image.load(path)
+            if scale != 1:
+                img = pygame.transform.rotozoom(img, 0, scale)
+            scaled.append(img)
+
+        size, positions = pack([x.get_size() for x in scaled])
+        surface = pygame.Surface(size, pygame.SRCALPHA, 32)
+        surface.fill((0, 0, 0, 0))
+        rects = dict()
+        for key, img, position in zip(images, scaled, positions):
+            # Max against the cleared atlas copies the pixels, alpha included
+            surface.blit(img, position, special_flags = pygame.BLEND_RGBA_MAX)
+            rects[key] = pygame.Rect(position, img.get_size())
+        return cls(surface, rects)
+
+    def save(self, path):
+        pygame.image.save(self.surface, path + ".png")
+        index = [[key[0], key[1]] + list(rect) for key, rect in self.rects.items()]
+        with open(path + ".json", "w") as json_file:
+            json.dump({"version": VERSION, "images": index}, json_file)
+
+    @classmethod
+    def load(cls, path):
+        with open(path + ".json") as json_file:
+            index = json.load(json_file)
+        if index["version"] != VERSION:
+            raise ValueError("Unsupported atlas version " + str(index["version"]))
+        rects = {(x[0], x[1]): pygame.Rect(x[2:]) for x in index["images"]}
+        return cls(pygame.image.load(path + ".png"), rects)
+
+
+def cache_path(images, screen_size, cache_dir):
+    return os.path.join(cache_dir, "atlas_%dx%d_%s" % (tuple(screen_size) +
+        (content_hash(images, screen_size),)))
+
+
+def save_to_cache(sprite_atlas, images, screen_size, cache_dir):
+    """ Save an atlas for screen_size, replacing stale ones. Returns the path """
+    path = cache_path(images, screen_size, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    for stale in glob.glob(os.path.join(cache_dir, "atlas_%dx%d_*" % tuple(screen_size))):
+        os.remove(stale)
+    sprite_atlas.save(path)
+    return path
+
+
+def build(manifest, screen_size = None, cache_dir = None):
+    """ Build and save the atlas for screen_size. Returns the atlas and its path """
+    screen_size = screen_size or config.ScreenInfo.size
+    cache_dir = cache_dir or config.EngineInfo.atlas_dir
+    images = sprite_images(manifest, screen_size)
+    sprite_atlas = SpriteAtlas.build(images)
+    return sprite_atlas, save_to_cache(sprite_atlas, images, screen_size, cache_dir)
+
+
+def load_or_build(manifest, screen_size = None, cache_dir = None, convert = True):
+    """
+    Cached atlas for screen_size, built first if there isn't an up to date
+    one. If the cache directory isn't writable the atlas is still built, it
+    just isn't saved. Converting the surface needs a display mode, without
+    convert this is safe to call from a loader thread.
+
+    """
+    screen_size = screen_size or config.ScreenInfo.size
+    cache_dir = cache_dir or config.EngineInfo.atlas_dir
+    images = sprite_images(manifest, screen_size)
+    path = cache_path(images, screen_size, cache_dir)
+    if os.path.exists(path + ".png") and os.path.exists(path + ".json"):
+        sprite_atlas = SpriteAtlas.load(path)
+    else:
+        sprite_atlas = SpriteAtlas.build(images)
+        try:
+            save_to_cache(sprite_atlas, images, screen_size, cache_dir)
+        except OSError as error:
+            print("Couldn't cache the sprite atlas: " + str(error))
+    if convert:
+        sprite_atlas.surface = sprite_atlas.surface.convert_alpha()
+    return sprite_atlas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the sprite atlas")
+    parser.add_argument("--size", type=int, nargs=2, metavar=("WIDTH", "HEIGHT"),
+            default=config.ScreenInfo.size, help="Target screen size")
+    parser.add_argument("--cache-dir", default=config.EngineInfo.atlas_dir)
+    args = parser.parse_args()
+
+    import game_assets
+    manifest = game_assets.AssetManager.get_manifest()
+    start = time.perf_counter()
+    sprite_atlas, path = build(manifest, args.size, args.cache_dir)
+    print("%d images in a %dx%d atlas, built in %.0fms" % ((len(sprite_atlas),) +
+        sprite_atlas.surface.get_size() + ((time.perf_counter() - start) * 1e3,)))
+    print(path + ".png")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#!/bin/env python3
+"""
+Run many headless games in parallel and aggregate the results.
+
+Each game runs in a worker process with its own seed, an input policy and
+optional overrides for config.Difficulty. Scores, survival times and per
+frame timings are collected into a single report.
+
+    python batch.py --games 1000 --workers 8 --difficulty shark_speed=-3.5
+
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import time
+
+import config
+import simulation
+
+# config.Difficulty as shipped, so that overrides from one game don't leak
+# into the next game run by the same worker
+DIFFICULTY_DEFAULTS = {key: value for key, value in vars(config.Difficulty).items()
+        if not key.startswith("_")}
+
+
+def apply_difficulty(overrides):
+    for key, value in DIFFICULTY_DEFAULTS.items():
+        setattr(config.Difficulty, key, value)
+    for key, value in overrides.items():
+        if key not in DIFFICULTY_DEFAULTS:
+            raise KeyError("Unknown difficulty setting: " + key)
+        setattr(config.Difficulty, key, value)
+
+
+def make_policy(policy, seed, options):
+    if policy == "random":
+        return simulation.RandomPolicy(seed, options.get("probability", 0.45))
+    if policy == "periodic":
+        return simulation.PeriodicPolicy(options.get("period", 60),
+                options.get("hold", 25))
+    if policy == "never":
+        return simulation.never_press
+    raise ValueError("Unknown policy: " + policy)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_game(task):
+    """ Worker entry point, runs one game and returns its summary """
+    seed, policy, policy_options, difficulty, max_ticks = task
+    apply_difficulty(difficulty)
+
+    game = simulation.Simulation(seed, make_policy(policy, seed, policy_options))
+    frame_times = []
+    max_npcs = 0
+    npc_total = 0
+    while not game.done() and (max_ticks is None or game.ticks < max_ticks):
+        start = time.perf_counter()
+        game.step()
+        frame_times.append(time.perf_counter() - start)
+        npcs = game.actor_controller.npc_count
+        npc_total += npcs
+        max_npcs = max(max_npcs, npcs)
+
+    result = game.result()
+    frame_times.sort()
+    result.update({
+        "frame_mean_ms": sum(frame_times) / max(1, len(frame_times)) * 1e3,
+        "frame_p99_ms": percentile(frame_times, 0.99) * 1e3,
+        "frame_max_ms": (frame_times[-1] if frame_times else 0.0) * 1e3,
+        "npcs_mean": npc_total / float(max(1, len(frame_times))),
+        "npcs_max": max_npcs,
+    })
+    return result
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        "mean": sum(values) / max(1, len(values)),
+        "p50": percentile(values, 0.5),
+        "p90": percentile(values, 0.9),
+        "max": values[-1] if values else 0,
+    }
+
+
+def aggregate(results):
+    return {
+        "games": len(results),
+        "eaten_fraction": sum(1 for x in results if x["eaten"]) / float(max(1, len(results))),
+        "score": summarize([x["score"] for x in results]),
+        "survival_time": summarize([x["survival_time"] for x in results]),
+        "frame_mean_ms": summarize([x["frame_mean_ms"] for x in results]),
+        "frame_p99_ms": summarize([x["frame_p99_ms"] for x in results]),
+        "npcs_max": summarize([x["npcs_max"] for x in results]),
+    }
+
+
+def run_batch(games, first_seed = 0, workers = None, policy = "random",
+        policy_options = None, difficulty = None, max_ticks = None):
+    """ Run games seeded first_seed, first_seed + 1, ... and return the report """
+    tasks = [(seed, policy, policy_options or {}, difficulty or {}, max_ticks)
+            for seed in range(first_seed, first_seed + games)]
+
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers = workers,
+            initializer = simulation.init_headless) as executor:
+        results = list(executor.map(run_game, tasks, chunksize = 4))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "policy": policy,
+        "policy_options": policy_options or {},
+        "difficulty": dict(DIFFICULTY_DEFAULTS, **(difficulty or {})),
+        "max_ticks": max_ticks,
+        "wall_time": elapsed,
+        "ticks_per_second": sum(x["ticks"] for x in results) / max(elapsed, 1e-9),
+        "summary": aggregate(results),
+        "results": results,
+    }
+
+
+def parse_assignments(pairs):
+    """ ["shark_speed=-3.5", ...] to a dict of floats """
+    parsed = dict()
+    for pair in pairs or []:
+        key, _, value = pair.partition("=")
+        parsed[key] = float(value)
+    return parsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run headless games in parallel")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the first game")
+    parser.add_argument("--max-ticks", type=int, default=120 * 60 * 5)
+    parser.add_argument("--policy", choices=["random", "periodic", "never"], default="random")
+    parser.add_argument("--policy-option", nargs="*", metavar="KEY=VALUE",
+            help="e.g. probability=0.4 or period=60 hold=25")
+    parser.add_argument("--difficulty", nargs="*", metavar="KEY=VALUE",
+            help="Overrides for config.Difficulty, e.g. shark_interval_ms=1800")
+    parser.add_argument("--output", help="Write the full report to this JSON file")
+    args = parser.parse_args()
+
+    policy_options = parse_assignments(args.policy_option)
+    for key in ("period", "hold"):
+        if key in policy_options:
+            policy_options[key] = int(policy_options[key])
+
+    report = run_batch(args.games, args.seed, args.workers, args.policy,
+            policy_options, parse_assignments(args.difficulty), args.max_ticks)
+
+    summary = report["summary"]
+    print("games: %d in %.1fs (%d ticks/s)" % (summary["games"],
+        report["wall_time"], report["ticks_per_second"]))
+    print("eaten: %.0f%%" % (summary["eaten_fraction"] * 100))
+    for key in ("score", "survival_time", "frame_mean_ms", "frame_p99_ms", "npcs_max"):
+        stats = summary[key]
+        print("%-14s mean %8.2f  p50 %8.2f  p90 %8.2f  max %8.2f" % (key,
+            stats["mean"], stats["p50"], stats["p90"], stats["max"]))
+
+    if args.output:
+        with open(args.output, "w") as json_file:
+            json.dump(report, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
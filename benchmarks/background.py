@@ -0,0 +1,102 @@
+#!/bin/env python3
+"""
+Benchmark for getting the background onto the screen each frame.
+
+Compares blitting the whole static background, recompositing the parallax
+bands at their offsets every frame, and scenery.ScrollingBackground, which
+scrolls the bands in place. All three end up with the same pixels on
+screen, apart from the first one not moving. Run from the repository root
+with:
+
+    python -m benchmarks.background
+    python -m benchmarks.background --size 2560 1680
+
+"""
+
+import argparse
+import os
+import time
+
+import pygame
+
+import config
+import game_assets
+import simulation
+
+
+def full_blit(loader, screen, distance):
+    """ What the game did before scrolling, the whole image every frame """
+    screen.blit(loader.main_image, (0, 0))
+
+
+def recomposite(loader, screen, distance):
+    """ Full image plus every band blitted at its offset """
+    screen.blit(loader.main_image, (0, 0))
+    for layer in loader.scenery.layers:
+        layer.advance(distance)
+        screen.blit(layer.strip, layer.rect, layer.area())
+
+
+def scroll(loader, screen, distance):
+    """ scenery.ScrollingBackground, only the bands move """
+    loader.scenery.advance(distance)
+    loader.scenery.scroll(screen)
+
+
+STRATEGIES = {
+    "full_blit": full_blit,
+    "recomposite": recomposite,
+    "scroll": scroll,
+}
+
+
+def run(strategy, frames, speed, fps):
+    loader = game_assets.BackgroundLoader()
+    screen = pygame.Surface(config.ScreenInfo.size).convert()
+    loader.scenery.draw(screen)
+    distance = speed / float(fps)
+
+    start = time.perf_counter()
+    for i in range(frames):
+        strategy(loader, screen, distance)
+    elapsed = time.perf_counter() - start
+    return elapsed / frames * 1e3, screen
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--frames", type=int, default=2000)
+    parser.add_argument("--fps", type=int, default=config.EngineInfo.render_fps)
+    parser.add_argument("--size", type=int, nargs=2, metavar=("WIDTH", "HEIGHT"),
+            help="Screen size, the background is scaled to it")
+    args = parser.parse_args()
+
+    if args.size:
+        config.ScreenInfo.size = config.ScreenInfo.width, config.ScreenInfo.height = tuple(args.size)
+    simulation.init_headless()
+    if args.size:
+        # Stand in a background of the screen size
+        background_object = game_assets.AssetManager.get_manifest()["background"]
+        path = os.path.join(background_object["directory"], background_object["sprite"])
+        image = pygame.transform.smoothscale(pygame.image.load(path), args.size)
+        game_assets.AssetManager.images[(path, 1, False)] = image.convert()
+        scale = args.size[1] / float(config.ScreenInfo.reference_height)
+        for layer in background_object["layers"]:
+            layer["top"] = int(layer["top"] * scale)
+            layer["height"] = int(layer["height"] * scale)
+
+    speed = -config.Difficulty.fish_speed
+    screens = dict()
+    print("%dx%d, %d frames" % (config.ScreenInfo.size + (args.frames,)))
+    for name, strategy in STRATEGIES.items():
+        frame_ms, screens[name] = run(strategy, args.frames, speed, args.fps)
+        print("  %-12s %7.3f ms/frame" % (name, frame_ms))
+
+    same = (pygame.image.tobytes(screens["recomposite"], "RGB") ==
+            pygame.image.tobytes(screens["scroll"], "RGB"))
+    print("scroll matches recomposite" if same else "scroll differs from recomposite")
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
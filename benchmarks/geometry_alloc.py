@@ -0,0 +1,96 @@
+#!/bin/env python3
+"""
+Microbenchmark for the allocations made by Actor.update.
+
+Run from the repository root with:
+
+    python -m benchmarks.geometry_alloc
+
+"""
+
+import argparse
+import gc
+import timeit
+import tracemalloc
+
+import actor
+import geometry
+
+TIMESTEP = 1.0 / 120
+
+
+def make_actors(count):
+    actors = []
+    for i in range(count):
+        npc = actor.NpcFish(geometry.State(geometry.Vector(1000.0, 150.0 + i),
+            geometry.Vector(-216.0, 0.0), geometry.Vector(0.0, 0.0)),
+            geometry.Vector(40, 30))
+        npc.bounds = (geometry.Vector(-200, 150), geometry.Vector(1380, 840))
+        actors.append(npc)
+
+    player = actor.PlayerSeal()
+    player.bounds = (geometry.Vector(0, 150), geometry.Vector(1280, 840))
+    actors.append(player)
+    return actors
+
+
+def count_vectors(actors, rounds):
+    """ Count how many Vector objects get constructed per Actor.update """
+    constructed = [0]
+    original_init = geometry.Vector.__init__
+
+    def counting_init(self, *args, **kwargs):
+        constructed[0] += 1
+        original_init(self, *args, **kwargs)
+
+    geometry.Vector.__init__ = counting_init
+    try:
+        for _ in range(rounds):
+            for a in actors:
+                a.update(TIMESTEP)
+    finally:
+        geometry.Vector.__init__ = original_init
+    return constructed[0] / float(rounds * len(actors))
+
+
+def transient_bytes(actors, rounds):
+    """ Peak memory above the steady state while updating """
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start, _ = tracemalloc.get_traced_memory()
+    for _ in range(rounds):
+        for a in actors:
+            a.update(TIMESTEP)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak - start
+
+
+def gc_collections(actors, rounds):
+    """ How many generation 0 collections the updates triggered """
+    before = gc.get_stats()[0]["collections"]
+    for _ in range(rounds):
+        for a in actors:
+            a.update(TIMESTEP)
+    return gc.get_stats()[0]["collections"] - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--actors", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=1000)
+    args = parser.parse_args()
+
+    actors = make_actors(args.actors)
+    updates = args.rounds * len(actors)
+
+    seconds = timeit.timeit(lambda: [a.update(TIMESTEP) for a in actors], number=args.rounds)
+    print("Actor.update calls:       %d" % updates)
+    print("time per update:          %.3f us" % (seconds / updates * 1e6))
+    print("vectors per update:       %.2f" % count_vectors(actors, args.rounds))
+    print("transient bytes (peak):   %d" % transient_bytes(actors, args.rounds))
+    print("gen0 collections:         %d" % gc_collections(actors, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+#!/bin/env python3
+"""
+Benchmark suite for the per frame work of the game.
+
+Each stage drives the real game code with a given number of npcs on screen
+and reports mean/p50/p99 timings in milliseconds plus the memory allocated
+while it runs. Results can be saved as a JSON baseline and compared against
+a later run. Run from the repository root with:
+
+    python -m benchmarks.suite --counts 10 100 1000 --save baseline.json
+    python -m benchmarks.suite --compare baseline.json
+
+"""
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+
+import pygame
+
+import collision
+import config
+import controller
+import game_assets
+import geometry
+import simulation
+
+TIMESTEP = 1.0 / config.EngineInfo.tick_rate
+
+DEFAULT_COUNTS = [10, 100, 1000, 10000]
+
+
+def percentile(sorted_values, fraction):
+    """ Nearest rank percentile of an already sorted list """
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "mean_ms": sum(samples) / len(samples) * 1e3,
+        "p50_ms": percentile(samples, 0.5) * 1e3,
+        "p99_ms": percentile(samples, 0.99) * 1e3,
+    }
+
+
+def measure_allocations(fcn, repeat):
+    """ Peak and retained memory while calling fcn repeat times """
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    for _ in range(repeat):
+        fcn()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "alloc_peak_kb": (peak - start) / 1024.0,
+        "alloc_retained_kb": (current - start) / 1024.0,
+    }
+
+
+class Fixture:
+    """ An ActorController populated with count npcs spread over the screen """
+    def __init__(self, count, seed = 0):
+        self.rng = random.Random(seed)
+        self.actor_controller = controller.ActorController(geometry.Vector(0,0),
+                geometry.Vector(config.ScreenInfo.width, config.ScreenInfo.height))
+        self.creator = controller.NpcCreator(game_assets.FishLoader(),
+                game_assets.SharkLoader(), self.actor_controller.events,
+                rng = self.rng)
+
+        # Roughly one shark for every two fish, like the spawn timers
+        for i in range(count):
+            if i % 3 == 2:
+                self.creator.create_shark()
+            else:
+                self.creator.create_fish()
+
+        # Spread them out, sharks stay clear of the seal so the game goes on
+        player_right = self.actor_controller.player.rect.right
+        for key, min_x in (("new_fish", 0), ("new_shark", player_right + 100)):
+            for event in self.actor_controller.events.peek(key) or []:
+                position = event.value.actor.state.position
+                position.x = self.rng.uniform(min_x, config.ScreenInfo.width - 100)
+                event.value.set_actor(event.value.actor)
+        self.actor_controller.listen_to_events()
+
+    @property
+    def npc_count(self):
+        return (len(self.actor_controller.fish_sprite_group) +
+                len(self.actor_controller.shark_sprite_group))
+
+
+def stage_update_actors(count):
+    fixture = Fixture(count)
+    return lambda: fixture.actor_controller.update_actors(TIMESTEP), fixture
+
+
+def stage_draw_actors(count):
+    """ Dirty rect drawing, restoring the background under the sprites """
+    fixture = Fixture(count)
+    screen = pygame.Surface(config.ScreenInfo.size)
+    background = pygame.Surface(config.ScreenInfo.size)
+    return lambda: fixture.actor_controller.draw_actors(screen, background), fixture
+
+
+def stage_actor_update(count):
+    """ The per-object physics path, without the npc world """
+    fixture = Fixture(count)
+    actors = [x.actor for x in fixture.actor_controller.fish_sprite_group]
+    actors += [x.actor for x in fixture.actor_controller.shark_sprite_group]
+    actors.append(fixture.actor_controller.player.actor)
+    for a in actors:
+        if a.world is not None:
+            a.world.remove(a)
+
+    def run():
+        for a in actors:
+            a.update(TIMESTEP)
+            if getattr(a, "delete", False):
+                a.delete = False
+    return run, fixture
+
+
+def stage_spritecollide(count):
+    """ The original full group mask collision, nothing gets killed """
+    fixture = Fixture(count)
+    player = fixture.actor_controller.player
+    fish = fixture.actor_controller.fish_sprite_group
+    sharks = fixture.actor_controller.shark_sprite_group
+
+    def run():
+        pygame.sprite.spritecollide(player, fish, False, pygame.sprite.collide_mask)
+        pygame.sprite.spritecollide(player, sharks, False)
+    return run, fixture
+
+
+def stage_broad_phase(count):
+    """ The collision index query plus mask tests, nothing gets killed """
+    fixture = Fixture(count)
+    actor_controller = fixture.actor_controller
+    player = actor_controller.player
+
+    def run():
+        for fish in actor_controller.fish_index.query(player.rect):
+            collision.collide_cached_mask(player, fish)
+        actor_controller.shark_index.query(player.rect)
+    return run, fixture
+
+
+def stage_create_npcs(count):
+    """ Time count calls split between create_fish and create_shark """
+    fixture = Fixture(0)
+    creator = fixture.creator
+
+    def run():
+        for i in range(count):
+            if i % 3 == 2:
+                creator.create_shark()
+            else:
+                creator.create_fish()
+        fixture.actor_controller.events.clear()
+    return run, fixture
+
+
+STAGES = {
+    "update_actors": stage_update_actors,
+    "draw_actors": stage_draw_actors,
+    "actor_update": stage_actor_update,
+    "spritecollide": stage_spritecollide,
+    "broad_phase": stage_broad_phase,
+    "create_npcs": stage_create_npcs,
+}
+
+
+def run_stage(name, count, repeat, warmup):
+    fcn, fixture = STAGES[name](count)
+    for _ in range(warmup):
+        fcn()
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fcn()
+        samples.append(time.perf_counter() - start)
+
+    result = summarize(samples)
+    result.update(measure_allocations(fcn, max(1, repeat // 10)))
+    result["npcs_after"] = fixture.npc_count
+    return result
+
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(results, baseline, threshold):
+    """ Print mean and p99 ratios against a baseline, returns the regressions """
+    regressions = []
+    print("\n%-16s %7s %12s %12s" % ("stage", "npcs", "mean ratio", "p99 ratio"))
+    for name, by_count in results.items():
+        for count, result in by_count.items():
+            old = baseline.get(name, {}).get(count)
+            if not old:
+                continue
+            mean_ratio = result["mean_ms"] / max(old["mean_ms"], 1e-9)
+            p99_ratio = result["p99_ms"] / max(old["p99_ms"], 1e-9)
+            flag = ""
+            if mean_ratio > 1 + threshold:
+                flag = "  <- slower"
+                regressions.append((name, count, mean_ratio))
+            print("%-16s %7s %12.2f %12.2f%s" % (name, count, mean_ratio, p99_ratio, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the per frame stages")
+    parser.add_argument("--counts", type=int, nargs="+", default=DEFAULT_COUNTS)
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare against a saved JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.1,
+            help="Relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    simulation.init_headless()
+
+    results = {}
+    print("%-16s %7s %10s %10s %10s %12s" % ("stage", "npcs", "mean ms",
+        "p50 ms", "p99 ms", "peak KB"))
+    for name in args.stages:
+        results[name] = {}
+        for count in args.counts:
+            result = run_stage(name, count, args.repeat, args.warmup)
+            # JSON keys are strings, keep them that way for comparisons
+            results[name][str(count)] = result
+            print("%-16s %7d %10.3f %10.3f %10.3f %12.1f" % (name, count,
+                result["mean_ms"], result["p50_ms"], result["p99_ms"],
+                result["alloc_peak_kb"]))
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as json_file:
+            baseline = json.load(json_file)
+        regressions = compare(results, baseline["results"], args.threshold)
+
+    if args.save:
+        with open(args.save, "w") as json_file:
+            json.dump({"meta": metadata(), "results": results}, json_file, indent=2)
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
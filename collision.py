@@ -0,0 +1,140 @@
+#!/bin/env python3
+""" Broad phase collision checks between the player and the npcs. """
+
+import bisect
+
+import geometry
+
+
+def collide_cached_mask(left, right):
+    """
+    Like pygame.sprite.collide_mask, but both sprites must carry a cached
+    mask and mask_bounds (see game_assets.AssetManager.mask). The tight
+    bounds of the set bits are compared first, which rejects most pairs
+    without touching the masks.
+
+    """
+    left_rect = left.rect
+    right_rect = right.rect
+    left_bounds = left.mask_bounds
+    right_bounds = right.mask_bounds
+    if (left_rect.x + left_bounds.right <= right_rect.x + right_bounds.x or
+            right_rect.x + right_bounds.right <= left_rect.x + left_bounds.x or
+            left_rect.y + left_bounds.bottom <= right_rect.y + right_bounds.y or
+            right_rect.y + right_bounds.bottom <= left_rect.y + left_bounds.y):
+        return False
+    offset = (right_rect.x - left_rect.x, right_rect.y - left_rect.y)
+    return left.mask.overlap(right.mask, offset) is not None
+
+
+def _left_edge(sprite):
+    return sprite.rect.left
+
+
+class SweepIndex:
+    """
+    Sweep and prune index over one npc group, sorted by the left edge.
+
+    Npcs spawn at the right edge of the screen and all npcs of a type swim
+    left at the same speed, so spawn order is also left-to-right order and
+    it never changes. That lets the index stay sorted without any per frame
+    work: new sprites are appended, dead sprites drift to the front and get
+    pruned there, and a query is two bisections plus an AABB test on the
+    few sprites in between.
+
+    If npcs with different speeds end up in the same index the ordering can
+    change, so the index falls back to re-sorting before each query.
+
+    """
+    def __init__(self):
+        self.sprites = []
+        self.max_width = 0
+        self.speed = None
+        self.uniform_speed = True
+
+        # Scratch rectangles so that queries don't allocate
+        self._query_box = geometry.Rectangle(geometry.Vector(0,0), geometry.Vector(0,0))
+        self._candidate_box = geometry.Rectangle(geometry.Vector(0,0), geometry.Vector(0,0))
+
+    def __len__(self):
+        return len(self.sprites)
+
+    def insert(self, sprite):
+        speed = sprite.actor.state.velocity.x
+        if self.speed is None:
+            self.speed = speed
+        elif speed != self.speed:
+            self.uniform_speed = False
+
+        self.max_width = max(self.max_width, sprite.rect.width)
+        left = sprite.rect.left
+        if not self.sprites or left >= self.sprites[-1].rect.left:
+            # Usual case, the new sprite is the rightmost one
+            self.sprites.append(sprite)
+        else:
+            index = bisect.bisect_right(self.sprites, left, key=_left_edge)
+            self.sprites.insert(index, sprite)
+
+    def remove(self, sprite):
+        """ Remove a sprite straight away, e.g. because it got eaten """
+        try:
+            self.sprites.remove(sprite)
+        except ValueError:
+            pass
+
+    def prune(self):
+        """ Drop sprites that are no longer alive, call once per frame """
+        sprites = self.sprites
+        # Sprites that swam off the left edge are at the front
+        dead = 0
+        while dead < len(sprites) and not sprites[dead].alive():
+            dead += 1
+        if dead:
+            del sprites[:dead]
+
+        if not self.uniform_speed:
+            self.sprites = [x for x in sprites if x.alive()]
+
+        if not self.sprites:
+            self.speed = None
+            self.uniform_speed = True
+            self.max_width = 0
+
+    def drop_passed(self, x):
+        """
+        Drop sprites that are entirely left of x from the front. They can't
+        collide with anything at x or right of it again, as long as npcs only
+        swim left and the querying rect never moves left.
+
+        """
+        if not self.uniform_speed or self.speed is None or self.speed > 0:
+            return
+        sprites = self.sprites
+        passed = 0
+        while passed < len(sprites) and sprites[passed].rect.right <= x:
+            passed += 1
+        if passed:
+            del sprites[:passed]
+
+    def query(self, rect):
+        """ Return the sprites whose rect overlaps rect """
+        sprites = self.sprites
+        if not self.uniform_speed:
+            sprites.sort(key=_left_edge)
+
+        # Only sprites whose left edge is in this window can overlap
+        start = bisect.bisect_left(sprites, rect.left - self.max_width,
+                key=_left_edge)
+        stop = bisect.bisect_right(sprites, rect.right, key=_left_edge)
+
+        query_box = self._query_box.set(rect.left, rect.top, rect.width,
+                rect.height)
+        candidate_box = self._candidate_box
+        result = []
+        for i in range(start, stop):
+            sprite = sprites[i]
+            r = sprite.rect
+            if query_box.contains(candidate_box.set(r.left, r.top, r.width,
+                r.height)):
+                result.append(sprite)
+        return result
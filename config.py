@@ -2,15 +2,65 @@
 
 import pygame
 
-EVENT_MAPPING = {
-        "CREATE_NEW_FISH" : pygame.USEREVENT,
-        "CREATE_NEW_SHARK" : pygame.USEREVENT + 1,
-}
-
 class ScreenInfo:
     size = width, height = 1280, 840
+    # Screen height that the sprite scales in the asset list are meant for
+    reference_height = 840
     font = None
 
+class Difficulty:
+    """ Gameplay tuning, these are read whenever a game is set up """
+    # Time between spawns of each npc type at the base spawn rate
+    fish_interval_ms = 1000
+    shark_interval_ms = 2300
+    # The spawn rate is 1 + spawn_rate_growth * score times the base rate,
+    # at most spawn_rate_max times
+    spawn_rate_growth = 0.0
+    spawn_rate_max = 3.0
+    # One more npc per spawn every batch_score_step points, up to max_batch
+    # at once. 0 always spawns one
+    batch_score_step = 0
+    max_batch = 4
+    # Horizontal npc speeds in pixels per second
+    fish_speed = -216.0
+    shark_speed = -360.0
+
+class EngineInfo:
+    # Physics and game logic run at this many fixed ticks per second
+    tick_rate = 120
+    # Rendered frames per second, 0 renders as fast as possible
+    render_fps = 120
+    # Ticks run per rendered frame at most. When frames take longer than
+    # that the game slows down instead of falling further and further behind
+    max_ticks_per_frame = 8
+    # Frame time the spawn governor aims for, and the range it keeps the
+    # live npc cap in
+    frame_budget_ms = 1e3 / 120
+    min_npcs = 20
+    max_npcs = 400
+    # Step all npc physics together in numpy arrays, if numpy is installed
+    npc_world = True
+    # Killed npc sprites kept around per type for reuse
+    npc_pool_size = 256
+    # Load sprite images from a pre-scaled atlas, see atlas.py
+    sprite_atlas = True
+    atlas_dir = "assets/atlas"
+    # Scroll the parallax layers of the background, see scenery.py
+    scrolling_background = True
+    # "software" blits surfaces, "texture" draws through an SDL renderer if
+    # there is one, see render.py
+    renderer = "software"
+
+class AudioInfo:
+    # Mixer channels set aside for each category of sound effect, so a burst
+    # of one category can't take every channel. When they are all busy the
+    # one that started playing first gets cut off
+    channels = {"chomp": 3, "hit": 1}
+    # Channels left over for sounds without a category of their own
+    free_channels = 4
+    # The same sound doesn't start again sooner than this after it last did
+    min_interval_ms = {"chomp": 60, "hit": 250}
+
 class MetaColor(type):
     """ 
     This lets me have more control over the colors used. 
@@ -27,9 +77,15 @@ class MetaColor(type):
             "purple": (191, 66, 245),
     }
 
+    # pygame.Color objects are built once per name, treat them as read-only
+    color_cache = dict()
+
     def __getitem__(cls, color):
         """ This function lets me treat the Color class like a read-only dictionary. """
-        return pygame.Color(*cls.color_dictionary[color])
+        cached = cls.color_cache.get(color)
+        if cached is None:
+            cached = cls.color_cache[color] = pygame.Color(*cls.color_dictionary[color])
+        return cached
 
 class Color(object, metaclass=MetaColor):
     pass
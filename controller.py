@@ -4,21 +4,33 @@ import random
 import pygame
 
 import actor
+import collision
 import config
 import events
 import game_assets
 import geometry
+import npc_world
+import profiler
+import sound
+import spawner
+import text_cache
 
 """ Controller classes """
 
 class ActorController:
-    def __init__(self, screen_min, screen_max):
+    def __init__(self, screen_min, screen_max, events_manager = None,
+            loader_service = None):
         WAVE_HEIGHT = 150
+        # Every game gets its own events unless one is shared in
+        self.events = events_manager if events_manager is not None else events.GameEventsManager()
         self.screen_bounds = (screen_min + geometry.Vector(0,150), screen_max)
         self.npc_bounds = (screen_min - geometry.Vector(200,-150), screen_max + geometry.Vector(100,0))
+        # Npcs despawn once they are fully off the left edge of the screen
+        self.despawn_x = screen_min.x
         
         # Set up actors and sprites
-        player_sprite = game_assets.SealSprite(game_assets.AssetLoader())
+        player_sprite = game_assets.SealSprite(game_assets.AssetLoader(),
+                self.events)
         player = actor.PlayerSeal()
         # Set bounds
         player.bounds = (self.screen_bounds[0], self.screen_bounds[1])
@@ -26,18 +38,34 @@ class ActorController:
         player.size = geometry.Vector(player_sprite.rect.width, player_sprite.rect.height)
         player_sprite.set_actor(player)
 
-        self.player_sprite_group = pygame.sprite.GroupSingle()
+        # RenderUpdates groups remember where each sprite was drawn, so we
+        # only have to repaint the parts of the screen that changed
+        self.player_sprite_group = pygame.sprite.RenderUpdates()
         self.player_sprite_group.add(player_sprite)
 
         # Create npc groups
-        self.fish_sprite_group = pygame.sprite.Group()
-        self.shark_sprite_group = pygame.sprite.Group()
+        self.fish_sprite_group = pygame.sprite.RenderUpdates()
+        self.shark_sprite_group = pygame.sprite.RenderUpdates()
 
-        # Audio
-        self.chomp_audio = game_assets.ChompAudioLoader().audio
-        self.brrr_audio = game_assets.BrrrAudioLoader().audio
+        # Broad phase indexes so we only mask test npcs near the player
+        self.fish_index = collision.SweepIndex()
+        self.shark_index = collision.SweepIndex()
+
+        # Array backed npc physics, falls back to per actor updates
+        self.npc_world = None
+        if config.EngineInfo.npc_world and npc_world.NpcWorld.available():
+            self.npc_world = npc_world.NpcWorld()
+
+        # Audio, silent until loaded if there's a loader service. The sounds
+        # are only decoded for the first game
+        self.sounds = sound.manager
+        self.sounds.load(loader_service)
 
         self.score = 0
+        self.score_rect = None
+        # Built on first draw, the font isn't loaded before that
+        self.score_text = None
+        self.profiler = profiler.NULL_PROFILER
 
     @property
     def player(self):
@@ -51,72 +79,170 @@ class ActorController:
         # Create actor bounds
         actor_bounds = self.npc_bounds
 
-        sprite_list = events.GameEventsManager.consume("new_fish")
+        sprite_list = self.events.consume("new_fish")
         if sprite_list:
             new_sprites = [x.value for x in sprite_list]
             # Set bounds on new actors
             for n in new_sprites:
-                n.actor.bounds = actor_bounds
+                self.place_npc(n, actor_bounds)
                 # This will make the fish go faster
                 # n.actor.add_velocity(self.velocity_delta())
-                self.fish_sprite_group.add(n)
+                self.add_npc(n)
 
-        sprite_list = events.GameEventsManager.consume("new_shark")
+        sprite_list = self.events.consume("new_shark")
         if sprite_list:
             new_sprites = [x.value for x in sprite_list]
             # Set bounds on new actors
             for n in new_sprites:
-                n.actor.bounds = actor_bounds
+                self.place_npc(n, actor_bounds)
                 # n.actor.add_velocity(self.velocity_delta())
-                self.shark_sprite_group.add(n)
-
-    def update_actors(self):
+                self.add_npc(n, shark = True)
+
+    def place_npc(self, sprite, bounds):
+        """ Set a new npc's bounds and move it inside them """
+        npc = sprite.actor
+        npc.bounds = bounds
+        npc.despawn_x = self.despawn_x
+        # From here on npcs only move horizontally
+        npc.clamp_to_bounds()
+        sprite.rect.topleft = npc.state.position.to_tuple()
+
+    def add_to_world(self, sprite):
+        if self.npc_world is not None:
+            self.npc_world.add(sprite.actor)
+
+    def add_npc(self, sprite, shark = False):
+        """ Start simulating a placed npc """
+        self.add_to_world(sprite)
+        if shark:
+            self.shark_index.insert(sprite)
+            self.shark_sprite_group.add(sprite)
+        else:
+            self.fish_index.insert(sprite)
+            self.fish_sprite_group.add(sprite)
+
+    def clear_npcs(self):
+        """ Remove every npc without anyone having eaten it """
+        for group in (self.fish_sprite_group, self.shark_sprite_group):
+            for sprite in group.sprites():
+                sprite.actor.delete = True
+                sprite.kill()
+        self.fish_index = collision.SweepIndex()
+        self.shark_index = collision.SweepIndex()
+
+    def update_actors(self, dt):
+        """ Advance the game by one fixed tick of dt seconds """
         # Create new actors if we've received the signal
         self.listen_to_events()
-        # Check for collisions
-        pygame.sprite.spritecollide(self.player,
-                self.fish_sprite_group, True, pygame.sprite.collide_mask) 
-
-        result = pygame.sprite.spritecollide(self.player,
-                self.shark_sprite_group, False) 
+        self.profiler.mark("listen_to_events")
+        # Check for collisions, only npcs that pass the AABB test get a mask test
+        player = self.player
+        for fish in self.fish_index.query(player.rect):
+            if collision.collide_cached_mask(player, fish):
+                self.fish_index.remove(fish)
+                fish.kill()
+
+        result = self.shark_index.query(player.rect)
         if (result):
-            events.GameEventsManager.notify_with_event(events.AteBySharkEvent())
-            self.brrr_audio.play(0)
+            self.events.notify_with_event(events.AteBySharkEvent())
+            self.sounds.play("brrr_audio")
+        self.profiler.mark("collision")
         
         # Ordering is important here!
         # The sprite group update must be before the score update because the
         # sprites update uses the ate fish event
-        self.player_sprite_group.update()
-        self.fish_sprite_group.update()
-        self.shark_sprite_group.update()
+        if self.npc_world is not None:
+            self.npc_world.step(dt)
+        self.player_sprite_group.update(dt)
+        self.fish_sprite_group.update(dt)
+        self.shark_sprite_group.update(dt)
+        self.fish_index.prune()
+        self.shark_index.prune()
+        # The seal never moves sideways, npcs that swam past it can't hit it
+        self.fish_index.drop_passed(player.rect.left)
+        self.shark_index.drop_passed(player.rect.left)
+        self.profiler.mark("sprite_update")
 
         # Update score counter
-        result = events.GameEventsManager.consume("ate_fish")
+        result = self.events.consume("ate_fish")
         if (result):
-            self.chomp_audio.play(0)
+            self.sounds.play("chomp_audio")
             self.score += 1
 
             # The seal got fatter so she floats to the surface faster
-            delta_velocity = self.player.actor.delta_velocity
+            thrust = self.player.actor.thrust
             seal_accel = self.player.actor.state.acceleration
-            diff = seal_accel + delta_velocity
+            diff = seal_accel + thrust
             seal_accel.y -= diff.y * 0.05
+        self.profiler.mark("score")
 
-
-    def draw_actors(self, screen):
-        # Draw score counter
-        text = config.ScreenInfo.font.render("Fishes Eaten: " + str(self.score), True, config.Color["black"])
-        text_rect = text.get_rect()
-        text_rect.bottomright = (config.ScreenInfo.width - 10, config.ScreenInfo.height - 10)
-        screen.blit(text, text_rect)
+    @property
+    def npc_count(self):
+        return len(self.fish_sprite_group) + len(self.shark_sprite_group)
+
+
+    def draw_actors(self, screen, background = None, alpha = 1.0, scenery = None):
+        """
+        Draw the actors and the score, returns the list of rects that changed.
+
+        With a background the old sprite and score positions get restored
+        from it first, without one the caller is expected to have repainted
+        the whole screen. A scenery.ScrollingBackground gets scrolled after
+        that, its surface should be the background. Actors are drawn alpha
+        of the way from their position before the last tick to their
+        current one.
+
+        """
+        groups = (self.player_sprite_group, self.fish_sprite_group,
+                self.shark_sprite_group)
+        dirty_rects = []
+
+        # Restore the background everywhere we drew last frame, before
+        # drawing anything so that groups don't erase each other
+        if background is not None:
+            for group in groups:
+                group.clear(screen, background)
+            if self.score_rect:
+                screen.blit(background, self.score_rect, self.score_rect)
+                dirty_rects.append(self.score_rect)
+            # The profiler overlay is drawn over every frame again, erase
+            # it so the scenery doesn't scroll it along
+            overlay_rect = self.profiler.overlay_rect
+            if overlay_rect:
+                screen.blit(background, overlay_rect, overlay_rect)
+        if scenery is not None:
+            dirty_rects.extend(scenery.scroll(screen))
+
+        self.score_rect = self.draw_score(screen)
+        dirty_rects.append(self.score_rect)
 
         # Draw everything onto the screen
-        self.player_sprite_group.draw(screen)
-        self.fish_sprite_group.draw(screen)
-        self.shark_sprite_group.draw(screen)
+        if alpha >= 1.0:
+            for group in groups:
+                dirty_rects.extend(group.draw(screen))
+            return dirty_rects
+
+        # Collisions use the rects, so they only hold the interpolated
+        # positions while drawing
+        for group in groups:
+            for sprite in group:
+                sprite.rect.topleft = sprite.actor.interpolated_position(alpha)
+            dirty_rects.extend(group.draw(screen))
+            for sprite in group:
+                sprite.rect.topleft = sprite.actor.state.position.to_tuple()
+        return dirty_rects
+
+    def draw_score(self, screen):
+        """ Draw the score counter from pre-rendered digits, returns its rect """
+        if self.score_text is None:
+            self.score_text = text_cache.NumberText(config.ScreenInfo.font,
+                    "Fishes Eaten: ", config.Color["black"])
+        text_rect = self.score_text.get_rect(self.score)
+        text_rect.bottomright = (config.ScreenInfo.width - 10, config.ScreenInfo.height - 10)
+        return self.score_text.draw(screen, self.score, text_rect)
 
     def draw_game_over(self, screen):
-        text = config.ScreenInfo.font.render("You got eaten! You ate " +
+        text = text_cache.render("You got eaten! You ate " +
                 str(self.score) + " fishes. Happy Birthday!!",
                 True, config.Color["black"])
         text_rect = text.get_rect()
@@ -132,7 +258,7 @@ class GameController:
         "ENDSCREEN"
     ]
 
-    def __init__(self, actor_controller, background_loader):
+    def __init__(self, actor_controller, background_loader, loader_service = None):
         self.mode = self.MODE[0]
 
         self.handle_gamemode = {
@@ -147,11 +273,25 @@ class GameController:
                 self.MODE[2]: lambda self: self.MODE[1],
         }
 
+        # None while the game assets are still loading, the start screen
+        # can be shown without it
         self.actor_controller = actor_controller
         self.background_loader = background_loader
-        self.happy_birthday_audio = game_assets.HappyBirthdayLoader().audio
+        # Loaded along with the actor controller
+        self.sounds = sound.manager
 
         self.do_reset = False
+        self.profiler = profiler.NULL_PROFILER
+        # The screen has to be repainted in full when the mode changes
+        self.full_redraw = True
+        # and when the real background replaces its placeholder
+        background_loader.ready.add_done_callback(self.background_loaded)
+
+    def set_profiler(self, frame_profiler):
+        """ Attach a profiler.FrameProfiler to this game and its actors """
+        self.profiler = frame_profiler
+        if self.actor_controller is not None:
+            self.actor_controller.profiler = frame_profiler
 
     def transition(self):
         if self.mode == self.MODE[2]:
@@ -159,107 +299,205 @@ class GameController:
 
         # Configure playback
         if self.mode == self.MODE[1]:
-            self.happy_birthday_audio.play(-1)
+            self.sounds.play_music("happy_birthday")
         else:
-            self.happy_birthday_audio.fadeout(100)
+            self.sounds.fadeout_music(100)
 
         self.mode = self.transition_dict[self.mode](self)
+        self.full_redraw = True
 
     def active(self):
         return True if self.mode == self.MODE[1] else False
 
-    def tick(self, screen):
-        keys = pygame.key.get_pressed()
+    def background_loaded(self, future):
+        self.full_redraw = True
+
+    def ready(self):
+        """ False while this only shows the start screen during loading """
+        return self.actor_controller is not None
+
+    def tick(self, screen, keys = None, dt = None):
+        """
+        Run one tick and draw it, returns the list of screen rects that
+        changed.
+
+        keys defaults to pygame.key.get_pressed(), and screen can be None to
+        simulate without drawing anything.
+
+        """
+        self.update(keys, dt)
+        return self.draw(screen)
+
+    def update(self, keys = None, dt = None):
+        """
+        Advance the game by one fixed tick of dt seconds, by default
+        1 / config.EngineInfo.tick_rate. Nothing is drawn.
+
+        """
+        if dt is None:
+            dt = 1.0 / config.EngineInfo.tick_rate
+        if keys is None:
+            keys = pygame.key.get_pressed()
         if keys[pygame.K_SPACE]:
             if self.active():
-                self.actor_controller.player.actor.add_velocity()
-        if keys[pygame.K_s] and not self.active():
+                self.actor_controller.player.actor.add_velocity(dt)
+        if keys[pygame.K_s] and not self.active() and self.ready():
             # Transition modes
             self.transition()
 
         # Check for game ending condition
-        if events.GameEventsManager.consume("got_eaten"):
+        if self.ready() and self.actor_controller.events.consume("got_eaten"):
             self.transition()
-
-        # Handle game mode actions
-        self.handle_gamemode[self.mode](screen)
-
-    def press_to_continue(self, screen, text_string = "Press SPACE to swim, press s to start"):
-        text = config.ScreenInfo.font.render(text_string, True,
-                config.Color["black"])
-        text_rect = text.get_rect()
-        text_rect.center = (int(config.ScreenInfo.width / 2.0),
-                int(config.ScreenInfo.height * 3/4))
-        screen.blit (text, text_rect)
-
-    def start_screen_actions(self, screen):
-        text = config.ScreenInfo.font.render("SMOL SEAL GO CHOMP", True,
-                config.Color["black"])
+        self.profiler.mark("events")
+
+        if self.active():
+            self.actor_controller.update_actors(dt)
+            # The scenery goes by as fast as the fish swim
+            self.background_loader.scenery.advance(-config.Difficulty.fish_speed * dt)
+
+    def draw(self, screen, alpha = 1.0):
+        """
+        Draw the current mode, alpha of the way into the next tick. Returns
+        the list of screen rects that changed.
+
+        """
+        dirty_rects = self.handle_gamemode[self.mode](screen, alpha)
+        self.profiler.mark("draw")
+        return dirty_rects
+
+    def centered_text(self, text_string, height_fraction):
+        """ Rendered text and its rect, centered at height_fraction of the screen """
+        text = text_cache.render(text_string, True, config.Color["black"])
         text_rect = text.get_rect()
         text_rect.center = (int(config.ScreenInfo.width / 2.0),
-                int(config.ScreenInfo.height / 2.0))
-        screen.blit(text, text_rect)
-        # Add the press space to continue message
-        self.press_to_continue(screen)
-
-    def play_actions(self, screen):
-        screen.blit(self.background_loader.main_image,
-                pygame.Rect(0,0,config.ScreenInfo.width,
-                    config.ScreenInfo.height))
-        self.actor_controller.update_actors()
-        self.actor_controller.draw_actors(screen)
-
-    def end_screen_actions(self, screen):
-        text = config.ScreenInfo.font.render("You got eaten! You ate " +
-                str(self.actor_controller.score) + " fishes. Happy Birthday!!",
-                True, config.Color["black"])
-        text_rect = text.get_rect()
-        # Center the text
-        text_rect.center = (int(config.ScreenInfo.width / 2.0), int(config.ScreenInfo.height / 2.0))
-        screen.blit(text, text_rect)
-
-        self.press_to_continue(screen, "Press s to play again")
+                int(config.ScreenInfo.height * height_fraction))
+        return text, text_rect
+
+    def screen_text(self):
+        """ (text, rect) pairs shown over the current mode """
+        if self.mode == self.MODE[0]:
+            title = "SMOL SEAL GO CHOMP"
+            # Add the press space to continue message
+            if self.ready():
+                prompt = "Press SPACE to swim, press s to start"
+            else:
+                prompt = "Loading..."
+        elif self.mode == self.MODE[2]:
+            title = ("You got eaten! You ate " + str(self.actor_controller.score) +
+                    " fishes. Happy Birthday!!")
+            prompt = "Press s to play again"
+        else:
+            return []
+        return [self.centered_text(title, 1 / 2.0), self.centered_text(prompt, 3 / 4.0)]
+
+    def draw_background(self, screen):
+        return self.background_loader.scenery.draw(screen)
+
+    def start_screen_actions(self, screen, alpha = 1.0):
+        # Nothing changes on the start screen, only draw it once
+        if screen is None or not self.full_redraw:
+            return []
+        self.full_redraw = False
+
+        self.draw_background(screen)
+        for text, text_rect in self.screen_text():
+            screen.blit(text, text_rect)
+        return [screen.get_rect()]
+
+    def play_actions(self, screen, alpha = 1.0):
+        if screen is None:
+            return []
+
+        if self.full_redraw:
+            self.full_redraw = False
+            full_rect = self.draw_background(screen)
+            self.actor_controller.draw_actors(screen, alpha = alpha)
+            return [full_rect]
+        scenery = self.background_loader.scenery
+        return self.actor_controller.draw_actors(screen, scenery.surface, alpha,
+                scenery)
+
+    def end_screen_actions(self, screen, alpha = 1.0):
+        # The end screen is drawn over the last frame of the game, once
+        if screen is None or not self.full_redraw:
+            return []
+        self.full_redraw = False
+
+        dirty_rects = []
+        for text, text_rect in self.screen_text():
+            screen.blit(text, text_rect)
+            dirty_rects.append(text_rect)
+        return dirty_rects
 
 
 class NpcCreator:
-    def __init__(self, fish_loader, shark_loader, set_timer_fcn):
-        """ Use the timer set function to initialize the relevant events """
-        # Create a new fish every two seconds
-        set_timer_fcn(config.EVENT_MAPPING["CREATE_NEW_FISH"], int(1 * 1e3))
-        # Need the 0.1 offset, when the timers overlap bad things happen
-        set_timer_fcn(config.EVENT_MAPPING["CREATE_NEW_SHARK"], int(2.3 * 1e3))
+    def __init__(self, fish_loader, shark_loader, events_manager,
+            rng = None, tick_rate = 120, governor = None):
+        """
+        Spawns npcs on a spawner.SpawnScheduler, call tick() once per tick.
+
+        New npcs are announced on events_manager, which should be the one the
+        ActorController listens to. rng defaults to the global random module.
+        With a spawner.SpawnGovernor, spawns are dropped while there are more
+        live npcs than its cap.
 
+        """
         self.fish_loader = fish_loader
         self.shark_loader = shark_loader
+        self.events = events_manager
+        self.rng = rng if rng is not None else random
 
+        # Fish come before sharks when both are due on the same tick
+        self.scheduler = spawner.SpawnScheduler(tick_rate, governor)
+        self.scheduler.add_kind("fish", config.Difficulty.fish_interval_ms, 0)
+        self.scheduler.add_kind("shark", config.Difficulty.shark_interval_ms, 1)
+        self.spawn = {"fish": self.create_fish, "shark": self.create_shark}
 
-    def create_npc(self, npc_type, npc_size):
-        npc_state = geometry.State()
+    @property
+    def ticks(self):
+        return self.scheduler.ticks
+
+    def tick(self, score = 0, npc_count = 0):
+        """ Advance one tick and spawn whatever is due at this score """
+        for kind, count in self.scheduler.tick(score, npc_count):
+            create = self.spawn[kind]
+            for i in range(count):
+                create()
+
+    def create_npc(self, npc_type, npc_size, npc = None):
+        """ Set up the spawn state, reusing npc if a pooled one is given """
+        if npc is None:
+            npc = npc_type(geometry.State(), npc_size)
+        else:
+            npc.reset()
+            npc.size = npc_size
+        npc_state = npc.state
 
         npc_state.position.x = config.ScreenInfo.width - npc_size.x
-        npc_state.position.y = random.randrange(config.ScreenInfo.height - npc_size.y)
+        npc_state.position.y = self.rng.randrange(config.ScreenInfo.height - npc_size.y)
 
-        npc_state.velocity.x = -1.8
-        new_npc = npc_type(npc_state, npc_size)
-        return new_npc
+        npc_state.velocity.x = config.Difficulty.fish_speed
+        return npc
 
 
     def create_fish(self):
         fish_sprite = self.fish_loader.new_sprite()
 
         npc_size = geometry.Vector(*fish_sprite.rect.size)
-        npc_fish = self.create_npc(actor.NpcFish, npc_size)
+        npc_fish = self.create_npc(actor.NpcFish, npc_size, fish_sprite.actor)
 
         fish_sprite.set_actor(npc_fish)
-        events.GameEventsManager.notify_with_event(events.NewFishEvent(fish_sprite))
+        fish_sprite.events = self.events
+        self.events.notify_with_event(events.NewFishEvent(fish_sprite))
 
 
     def create_shark(self):
         shark_sprite = self.shark_loader.new_sprite()
 
         npc_size = geometry.Vector(*shark_sprite.rect.size)
-        npc = self.create_npc(actor.NpcShark, npc_size)
-        npc.state.velocity.x = -3.0
+        npc = self.create_npc(actor.NpcShark, npc_size, shark_sprite.actor)
+        npc.state.velocity.x = config.Difficulty.shark_speed
 
         shark_sprite.set_actor(npc)
-        events.GameEventsManager.notify_with_event(events.NewSharkEvent(shark_sprite))
+        shark_sprite.events = self.events
+        self.events.notify_with_event(events.NewSharkEvent(shark_sprite))
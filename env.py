@@ -0,0 +1,203 @@
+#!/bin/env python3
+"""
+Reinforcement learning style environments over the headless game.
+
+SealEnv wraps one simulation.Simulation behind reset(seed) and
+step(action), following the gymnasium conventions without depending on it.
+VectorSealEnv steps several independent games in lockstep and returns
+their observations stacked in one NumPy array. Nothing is drawn, so the
+step rate is only bounded by the game logic.
+
+    python env.py --games 16 --steps 20000
+
+An observation is a float32 array of OBSERVATION_SIZE values:
+
+    seal y / screen height, seal y velocity / SPEED_SCALE
+    then for the NEAREST fish and the NEAREST sharks, nearest first:
+        dx / screen width, dy / screen height, x velocity / SPEED_SCALE, present
+
+dx and dy go from the seal's center to the npc's center. Missing npcs are
+all zeros. Action 0 does nothing, action 1 swims.
+
+"""
+
+import argparse
+import heapq
+import random
+import time
+
+import numpy
+import pygame
+
+import config
+import simulation
+
+NEAREST = 3
+FEATURES = 4
+OBSERVATION_SIZE = 2 + 2 * NEAREST * FEATURES
+ACTIONS = 2
+# Velocities are divided by this, in pixels per second
+SPEED_SCALE = 1000.0
+
+ACTION_KEYS = (simulation.PressedKeys(), simulation.PressedKeys((pygame.K_SPACE,)))
+
+
+def observe(game, out):
+    """ Write the observation of a simulation.Simulation into out """
+    out.fill(0.0)
+    actor_controller = game.actor_controller
+    seal = actor_controller.player
+    state = seal.actor.state
+    width = float(config.ScreenInfo.width)
+    height = float(config.ScreenInfo.height)
+    out[0] = state.position.y / height
+    out[1] = state.velocity.y / SPEED_SCALE
+
+    center_x, center_y = seal.rect.center
+    offset = 2
+    for group in (actor_controller.fish_sprite_group, actor_controller.shark_sprite_group):
+        npcs = []
+        for sprite in group:
+            dx = sprite.rect.centerx - center_x
+            dy = sprite.rect.centery - center_y
+            npcs.append((dx * dx + dy * dy, dx, dy, sprite.actor.state.velocity.x))
+        for i, npc in enumerate(heapq.nsmallest(NEAREST, npcs)):
+            start = offset + i * FEATURES
+            out[start:start + FEATURES] = (npc[1] / width, npc[2] / height,
+                    npc[3] / SPEED_SCALE, 1.0)
+        offset += NEAREST * FEATURES
+    return out
+
+
+class SealEnv:
+    """
+    One game. Each step holds the action for frame_skip ticks. The reward
+    is the number of fish eaten during the step, plus eaten_reward if the
+    seal got eaten, which ends the episode. Episodes are truncated after
+    max_ticks ticks.
+
+    Without a seed for reset() each episode gets the next seed from a
+    generator seeded with the seed given here, so a run of episodes is
+    reproducible too.
+
+    """
+    def __init__(self, seed = None, frame_skip = 1, max_ticks = None,
+            eaten_reward = -1.0):
+        self.seeds = random.Random(seed)
+        self.frame_skip = frame_skip
+        self.max_ticks = max_ticks
+        self.eaten_reward = eaten_reward
+        self.game = simulation.Simulation(seed, simulation.never_press)
+        self.observation = numpy.zeros(OBSERVATION_SIZE, dtype=numpy.float32)
+
+    def reset(self, seed = None):
+        """ Start a new episode, returns (observation, info) """
+        self.game.seed = seed if seed is not None else self.seeds.getrandbits(62)
+        self.game.reset()
+        return self.observe(), {"seed": self.game.seed}
+
+    def observe(self, out = None):
+        return observe(self.game, out if out is not None else self.observation)
+
+    def step(self, action, out = None):
+        """
+        Returns (observation, reward, terminated, truncated, info). With out
+        the observation is written there instead of a buffer of the env.
+
+        """
+        game = self.game
+        keys = ACTION_KEYS[int(action)]
+        score = game.actor_controller.score
+        for i in range(self.frame_skip):
+            game.advance(keys)
+            if game.done():
+                break
+
+        terminated = game.done()
+        truncated = (not terminated and self.max_ticks is not None and
+                game.ticks >= self.max_ticks)
+        reward = float(game.actor_controller.score - score)
+        if terminated:
+            reward += self.eaten_reward
+        info = {"score": game.actor_controller.score, "ticks": game.ticks}
+        return self.observe(out), reward, terminated, truncated, info
+
+
+class VectorSealEnv:
+    """
+    num_games SealEnvs stepped in lockstep in this process. Observations
+    come back as a (num_games, OBSERVATION_SIZE) array and rewards,
+    terminations and truncations as arrays of num_games.
+
+    Games that end are reset straight away. Their last observation is in
+    info["final_observation"] and the returned one starts the next episode.
+    Game i is seeded with seed + i.
+
+    """
+    def __init__(self, num_games, seed = None, frame_skip = 1, max_ticks = None,
+            eaten_reward = -1.0):
+        base_seed = seed if seed is not None else random.getrandbits(62)
+        self.envs = [SealEnv(base_seed + i, frame_skip, max_ticks, eaten_reward)
+                for i in range(num_games)]
+        self.observations = numpy.zeros((num_games, OBSERVATION_SIZE),
+                dtype=numpy.float32)
+        self.rewards = numpy.zeros(num_games, dtype=numpy.float32)
+        self.terminated = numpy.zeros(num_games, dtype=bool)
+        self.truncated = numpy.zeros(num_games, dtype=bool)
+
+    def __len__(self):
+        return len(self.envs)
+
+    def reset(self, seed = None):
+        """ Reset every game, returns (observations, infos) """
+        infos = []
+        for i, env in enumerate(self.envs):
+            env.reset(seed + i if seed is not None else None)
+            env.observe(self.observations[i])
+            infos.append({"seed": env.game.seed})
+        return self.observations, infos
+
+    def step(self, actions):
+        """ Step game i with actions[i] """
+        infos = []
+        for i, env in enumerate(self.envs):
+            observation = self.observations[i]
+            _, reward, terminated, truncated, info = env.step(actions[i], observation)
+            if terminated or truncated:
+                info["final_observation"] = observation.copy()
+                env.reset()
+                env.observe(observation)
+            self.rewards[i] = reward
+            self.terminated[i] = terminated
+            self.truncated[i] = truncated
+            infos.append(info)
+        return self.observations, self.rewards, self.terminated, self.truncated, infos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure environment steps per second")
+    parser.add_argument("--games", type=int, default=8)
+    parser.add_argument("--steps", type=int, default=10000,
+            help="Steps of the vectorized env, each steps every game")
+    parser.add_argument("--frame-skip", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    vector_env = VectorSealEnv(args.games, args.seed, args.frame_skip)
+    vector_env.reset(args.seed)
+    rng = numpy.random.default_rng(args.seed)
+    episodes = 0
+    start = time.perf_counter()
+    for i in range(args.steps):
+        actions = rng.integers(0, ACTIONS, size=args.games)
+        _, _, terminated, truncated, _ = vector_env.step(actions)
+        episodes += int(numpy.count_nonzero(terminated | truncated))
+    elapsed = time.perf_counter() - start
+
+    env_steps = args.steps * args.games
+    print("%d env steps in %.2fs, %d steps/s, %d ticks/s, %d episodes" % (env_steps,
+        elapsed, env_steps / elapsed, env_steps * args.frame_skip / elapsed, episodes))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 #!/bin/env python3
 """ This file implements an observer pattern. """
 
+import collections
+
 class GameEvent:
     """ Parent class for game events """
     def __init__(self, key):
@@ -12,45 +14,108 @@ class GameEvent:
 
 
 class GameEventsManager:
-    """ Singleton class managing an events object. """
-    # Static events dictionary
-    events = dict()
-
-    @classmethod
-    def notify(cls, key, value):
-        if not key in cls.events:
-            cls.events[key] = [value]
-        else:
-            cls.events[key].append(value)
-
-    @classmethod
-    def notify_with_event(cls, event):
-        cls.notify(event.key, event)
-
-    @classmethod
-    def consume(cls, key):
-        if key in cls.events:
-            ret_val = cls.events[key]
-            del cls.events[key]
-            return ret_val
-        return None
-
-    @classmethod
-    def peek(cls, key):
-        if key in cls.events:
-            return cls.events[key]
-        return None
-
-    @classmethod
-    def consume_event_for_value(cls, key, value):
-        result_list = cls.peek(key)
-        if result_list:
-            output_list = [x for x in result_list if x.contains(value)]
-            # Remove output list elements from base list
-            for x in output_list:
-                result_list.remove(x)
-            return output_list
-        return list()
+    """
+    Event bus for one game.
+
+    Events are queued per key until someone consumes them. Subscribers are
+    called as soon as an event with their key is notified, so they don't
+    have to poll. Each game owns its own manager, so several games can run
+    in one process.
+
+    """
+    def __init__(self):
+        # key -> deque of queued events
+        self.events = dict()
+        # key -> {value: deque of queued events with that value}
+        self.value_index = dict()
+        # key -> list of callbacks
+        self.subscribers = dict()
+        # Events consumed by value that are still sitting in a key's deque
+        self.consumed = set()
+
+    def subscribe(self, key, callback):
+        """ Call callback(event) whenever an event with key is notified """
+        self.subscribers.setdefault(key, []).append(callback)
+
+    def unsubscribe(self, key, callback):
+        callbacks = self.subscribers.get(key)
+        if callbacks and callback in callbacks:
+            callbacks.remove(callback)
+
+    def notify(self, key, value):
+        self.queue(key, value)
+        callbacks = self.subscribers.get(key)
+        if callbacks:
+            for callback in callbacks:
+                callback(value)
+
+    def queue(self, key, value):
+        """
+        Queue an event without calling the subscribers, for events that were
+        already announced once, e.g. when restoring a snapshot
+
+        """
+        queue = self.events.get(key)
+        if queue is None:
+            queue = self.events[key] = collections.deque()
+        queue.append(value)
+
+        # Index by the event's value so it can be found without a scan
+        indexed_value = getattr(value, "value", None)
+        if indexed_value is not None:
+            by_value = self.value_index.setdefault(key, dict())
+            by_value.setdefault(indexed_value, collections.deque()).append(value)
+
+    def notify_with_event(self, event):
+        self.notify(event.key, event)
+
+    def consume(self, key):
+        """ Remove and return every queued event for key, None if there aren't any """
+        queue = self.events.pop(key, None)
+        self.value_index.pop(key, None)
+        if not queue:
+            return None
+        if self.consumed:
+            result = [x for x in queue if id(x) not in self.consumed]
+            self.consumed.difference_update(id(x) for x in queue)
+            return result or None
+        return list(queue)
+
+    def peek(self, key):
+        """ Queued events for key without consuming them, None if there aren't any """
+        queue = self.events.get(key)
+        if not queue:
+            return None
+        if self.consumed:
+            return [x for x in queue if id(x) not in self.consumed] or None
+        return list(queue)
+
+    def has(self, key):
+        """ Cheaper than peek when only the presence matters """
+        if self.consumed:
+            return self.peek(key) is not None
+        return bool(self.events.get(key))
+
+    def pending_count(self):
+        """ Number of events waiting to be consumed """
+        return sum(len(x) for x in self.events.values()) - len(self.consumed)
+
+    def consume_event_for_value(self, key, value):
+        """ Remove and return the queued events for key whose value is value """
+        by_value = self.value_index.get(key)
+        if not by_value:
+            return list()
+        matches = by_value.pop(value, None)
+        if not matches:
+            return list()
+        # They are dropped from the key's deque lazily, on consume
+        self.consumed.update(id(x) for x in matches)
+        return list(matches)
+
+    def clear(self):
+        self.events.clear()
+        self.value_index.clear()
+        self.consumed.clear()
 
 class NewFishEvent(GameEvent):
     def __init__(self, npc):
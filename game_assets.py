@@ -1,43 +1,324 @@
 #!/bin/env python3
 
+import concurrent.futures
 import json
 import os
 import pygame
+import atlas
+import config
 import events
+import scenery
 
 def load_img_with_alpha(path):
-    img = pygame.image.load(path)
-    img.convert_alpha()
-    return img
+    return pygame.image.load(path).convert_alpha()
+
+
+class AssetManager:
+    """
+    Process wide cache of everything that gets loaded from disk.
+
+    The manifest is parsed once, each image is decoded, scaled and converted
+    once per scale, and each sound is decoded once. Loaders built on a game
+    reset get the same objects back. Images need a display mode before they
+    can be converted, so nothing is loaded until it's first asked for.
+
+    Sprite images come out of the atlas when config.EngineInfo.sprite_atlas
+    is on, anything that isn't in it is loaded on its own.
+
+    """
+    ASSET_LIST = "assets/game_assets.json"
+    manifest = None
+    images = dict()
+    sounds = dict()
+    masks = dict()
+    strips = dict()
+    # atlas.SpriteAtlas, False if it couldn't be loaded
+    atlas = None
+
+    @classmethod
+    def get_manifest(cls):
+        if cls.manifest is None:
+            with open(cls.ASSET_LIST) as json_file:
+                cls.manifest = json.load(json_file)
+        return cls.manifest
+
+    @classmethod
+    def image(cls, path, scale = 1, alpha = True):
+        """ Converted surface for path, scaled with rotozoom """
+        key = (path, scale, alpha)
+        img = cls.images.get(key)
+        if img is None and alpha:
+            sprite_atlas = cls.get_atlas()
+            if sprite_atlas:
+                img = sprite_atlas.image(path, scale)
+                if img is not None:
+                    cls.images[key] = img
+        if img is None:
+            img = cls.add_image(key, cls.decode_image(path, scale))
+        return img
+
+    @staticmethod
+    def decode_image(path, scale = 1):
+        """ Load and scale an image without converting it, safe on any thread """
+        img = pygame.image.load(path)
+        if scale != 1:
+            img = pygame.transform.rotozoom(img, 0, scale)
+        return img
+
+    @classmethod
+    def add_image(cls, key, img):
+        """ Convert a decoded image and cache it under (path, scale, alpha) """
+        img = img.convert_alpha() if key[2] else img.convert()
+        return cls.images.setdefault(key, img)
+
+    @classmethod
+    def get_atlas(cls):
+        if cls.atlas is None:
+            cls.atlas = False
+            if config.EngineInfo.sprite_atlas:
+                try:
+                    cls.atlas = atlas.load_or_build(cls.get_manifest())
+                except (pygame.error, ValueError, KeyError) as error:
+                    print("Not using the sprite atlas: " + str(error))
+        return cls.atlas
+
+    @classmethod
+    def set_atlas(cls, sprite_atlas):
+        """ Use an atlas that was loaded without converting it """
+        if cls.atlas is None:
+            sprite_atlas.surface = sprite_atlas.surface.convert_alpha()
+            cls.atlas = sprite_atlas
+        return cls.atlas
+
+    @classmethod
+    def sound(cls, path):
+        audio = cls.sounds.get(path)
+        if audio is None:
+            audio = cls.sounds[path] = pygame.mixer.Sound(path)
+        return audio
+
+    @classmethod
+    def mask(cls, surface, front_fraction = None):
+        """
+        Collision mask of a loaded surface and the bounding rect of its set
+        bits, relative to the surface. With front_fraction only the rightmost
+        fraction of the surface collides.
+
+        """
+        key = (surface, front_fraction)
+        cached = cls.masks.get(key)
+        if cached is None:
+            mask = pygame.mask.from_surface(surface)
+            if front_fraction is not None:
+                width, height = mask.get_size()
+                back = pygame.Mask((width - int(width * front_fraction), height),
+                        fill = True)
+                mask.erase(back, (0, 0))
+            rects = mask.get_bounding_rects()
+            bounds = rects[0].unionall(rects[1:]) if rects else pygame.Rect(0, 0, 0, 0)
+            cached = cls.masks[key] = (mask, bounds)
+        return cached
+
+    @classmethod
+    def strip(cls, surface, rect, width):
+        """ scenery.tile_strip of a loaded surface, built once """
+        key = (surface, tuple(rect), width)
+        strip = cls.strips.get(key)
+        if strip is None:
+            strip = cls.strips[key] = scenery.tile_strip(surface, rect, width)
+        return strip
+
+    @classmethod
+    def clear(cls):
+        cls.manifest = None
+        cls.atlas = None
+        cls.images.clear()
+        cls.sounds.clear()
+        cls.masks.clear()
+        cls.strips.clear()
+
+
+def done_future(result):
+    future = concurrent.futures.Future()
+    future.set_result(result)
+    return future
+
+
+class LoaderService:
+    """
+    Decodes images and sounds on a thread pool, without blocking the game.
+
+    Every request returns a concurrent.futures.Future. Decoding happens on a
+    worker thread, pygame releases the GIL for most of it. Converting and
+    caching the result in the AssetManager happens on the main thread in
+    poll(), so futures resolve and run their callbacks there too. Call
+    poll() once per frame.
+
+    """
+    def __init__(self, workers = 2, timeline = None):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers = workers,
+                thread_name_prefix = "asset-loader")
+        # startup.StartupTimeline that gets a span per decoded asset
+        self.timeline = timeline
+        # key -> (worker future, finish function, future handed out)
+        self.pending = dict()
+
+    def submit(self, key, name, work, finish):
+        """
+        Run work() on a worker thread, then finish(result) in poll(). The
+        future resolves to what finish returns. Requests for a key that is
+        still loading share the future.
+
+        """
+        request = self.pending.get(key)
+        if request is not None:
+            return request[2]
+        if self.timeline is not None:
+            def timed_work():
+                with self.timeline.span("loader", name):
+                    return work()
+            worker_future = self.executor.submit(timed_work)
+        else:
+            worker_future = self.executor.submit(work)
+        future = concurrent.futures.Future()
+        self.pending[key] = (worker_future, finish, future)
+        return future
+
+    def image(self, path, scale = 1, alpha = True):
+        key = (path, scale, alpha)
+        img = AssetManager.images.get(key)
+        if img is not None:
+            return done_future(img)
+        return self.submit(key, os.path.basename(path),
+                lambda: AssetManager.decode_image(path, scale),
+                lambda img: AssetManager.add_image(key, img))
+
+    def sound(self, path):
+        audio = AssetManager.sounds.get(path)
+        if audio is not None:
+            return done_future(audio)
+        return self.submit(path, os.path.basename(path),
+                lambda: pygame.mixer.Sound(path),
+                lambda audio: AssetManager.sounds.setdefault(path, audio))
+
+    def sprite_atlas(self):
+        """ Resolves to the atlas, or False if the atlas is off or broken """
+        if AssetManager.atlas is not None or not config.EngineInfo.sprite_atlas:
+            return done_future(AssetManager.get_atlas())
+        manifest = AssetManager.get_manifest()
+        return self.submit("sprite atlas", "sprite atlas",
+                lambda: atlas.load_or_build(manifest, convert = False),
+                AssetManager.set_atlas)
+
+    def poll(self):
+        """ Finish the requests that are decoded, returns how many are left """
+        if not self.pending:
+            return 0
+        for key, (worker_future, finish, future) in list(self.pending.items()):
+            if not worker_future.done():
+                continue
+            del self.pending[key]
+            try:
+                result = finish(worker_future.result())
+            except Exception as error:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        return len(self.pending)
+
+    def shutdown(self):
+        self.executor.shutdown(wait = False, cancel_futures = True)
+
+
+class PendingSound:
+    """ Stands in for a pygame.mixer.Sound that is still loading, it's silent until then """
+    def __init__(self, future):
+        self.future = future
+        self.sound = None
+
+    def resolve(self):
+        if self.sound is None and self.future.done() and self.future.exception() is None:
+            self.sound = self.future.result()
+        return self.sound
+
+    def play(self, *args, **kwargs):
+        sound = self.resolve()
+        return sound.play(*args, **kwargs) if sound is not None else None
+
+    def stop(self):
+        sound = self.resolve()
+        if sound is not None:
+            sound.stop()
+
+    def fadeout(self, time):
+        sound = self.resolve()
+        if sound is not None:
+            sound.fadeout(time)
 
 
 class Animation:
-    def __init__(self, image_list, num_frames):
+    """ Shows each image for frame_time seconds, whatever the tick rate """
+    def __init__(self, image_list, frame_time):
         self.image_list = image_list
-        self.num_frames = num_frames
+        self.frame_time = frame_time
         self.active = False
-        self.index = 0
+        # Seconds since the animation started
+        self.elapsed = 0.0
 
-    def tick(self):
+    def tick(self, dt):
         if self.active:
-            if self.index >= len(self.image_list) * self.num_frames:
+            # The small offset keeps rounding in elapsed from holding a frame
+            # for an extra tick
+            index = int(self.elapsed / self.frame_time + 1e-9)
+            if index >= len(self.image_list):
                 # Set animation to false if this is the last image
                 self.active = False
-                self.index = 0
+                self.elapsed = 0.0
                 return None
 
-            current_image = self.image_list[self.index // self.num_frames]
-            self.index += 1
-
-            return current_image
+            self.elapsed += dt
+            return self.image_list[index]
         return None
 
 
+class SpritePool:
+    """
+    Free list of killed npc sprites of one type.
+
+    Sprites go back into the pool when they are killed and come out again,
+    actor and all, the next time a sprite of that type is needed. Whoever
+    takes one out is responsible for resetting it.
+
+    """
+    def __init__(self, factory, max_size = None):
+        self.factory = factory
+        self.max_size = max_size if max_size is not None else config.EngineInfo.npc_pool_size
+        self.free = []
+        self.hits = 0
+        self.misses = 0
+        self.dropped = 0
+
+    def acquire(self):
+        if self.free:
+            self.hits += 1
+            return self.free.pop()
+        self.misses += 1
+        return self.factory()
+
+    def release(self, sprite):
+        if len(self.free) < self.max_size:
+            self.free.append(sprite)
+        else:
+            self.dropped += 1
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "dropped": self.dropped, "free": len(self.free)}
+
+
 class AssetLoader:
-    ASSET_LIST = "assets/game_assets.json"
     def __init__(self):
-        with open(self.ASSET_LIST) as json_file:
-            self.asset_object = json.load(json_file)
+        self.asset_object = AssetManager.get_manifest()
 
 class FishLoader(AssetLoader):
     """ Factory class that produces fishes """
@@ -48,57 +329,97 @@ class FishLoader(AssetLoader):
         raw_path = fish_object["sprite"]
         sprite_path = os.path.join(fish_object["directory"], raw_path)
 
+        self.scale = atlas.sprite_scale(fish_object)
         self.main_image = self.load_images(sprite_path)
+        self.pool = SpritePool(self.create_sprite)
+        # Shared by every sprite of this type
+        self.mask, self.mask_bounds = AssetManager.mask(self.main_image)
 
     def load_images(self, full_path):
-        img = Sprite.load_images(full_path)
-        # Resize fish
-        img = pygame.transform.rotozoom(img, 0, 0.2)
-        return img
+        # Resize to the scale in the asset list
+        return AssetManager.image(full_path, self.scale)
+
+    def create_sprite(self):
+        return FishSprite(self.main_image, self.pool, self.mask, self.mask_bounds)
 
     def new_sprite(self):
-        new_sprite = FishSprite(self.main_image)
-        return new_sprite
+        """ A fish sprite from the pool, its actor needs resetting if it has one """
+        return self.pool.acquire()
 
 class SharkLoader(FishLoader):
     ASSET_NAME = "shark"
     def __init__(self):
         super().__init__()
 
-    def load_images(self, full_path):
-        img = Sprite.load_images(full_path)
-        img = pygame.transform.rotozoom(img, 0, 0.5)
-        return img
+    def create_sprite(self):
+        return SharkSprite(self.main_image, self.pool, self.mask, self.mask_bounds)
 
-    def new_sprite(self):
-        new_sprite = SharkSprite(self.main_image)
-        return new_sprite
+class BackgroundLoader(AssetLoader):
+    """
+    The background image. With a LoaderService it's decoded on a worker
+    thread and a plain fill stands in for it until ready resolves.
+
+    scenery is the scenery.ScrollingBackground to draw. Its parallax layers
+    only scroll once the real image is loaded, and only with
+    config.EngineInfo.scrolling_background on.
 
-class BackgroundLoader(FishLoader):
+    """
     ASSET_NAME = "background"
-    def __init__(self):
+    def __init__(self, service = None):
         super().__init__()
-
-    def load_images(self, full_path):
-        return pygame.image.load(full_path).convert()
+        background_object = self.asset_object[self.ASSET_NAME]
+        full_path = os.path.join(background_object["directory"],
+                background_object["sprite"])
+
+        if service is None:
+            self.main_image = AssetManager.image(full_path, alpha = False)
+            self.ready = done_future(self.main_image)
+            self.scenery = self.build_scenery()
+        else:
+            self.main_image = pygame.Surface(config.ScreenInfo.size).convert()
+            self.main_image.fill(config.Color["blue"])
+            self.scenery = scenery.ScrollingBackground(self.main_image)
+            self.ready = service.image(full_path, alpha = False)
+            self.ready.add_done_callback(self.loaded)
+
+    def loaded(self, future):
+        if future.exception() is None:
+            self.main_image = future.result()
+            self.scenery = self.build_scenery()
+
+    def build_scenery(self):
+        layers = []
+        if config.EngineInfo.scrolling_background:
+            width = config.ScreenInfo.width
+            image_width = self.main_image.get_width()
+            for layer_object in self.asset_object[self.ASSET_NAME].get("layers", []):
+                top = layer_object["top"]
+                height = layer_object["height"]
+                strip = AssetManager.strip(self.main_image,
+                        pygame.Rect(0, top, image_width, height), width)
+                layers.append(scenery.ParallaxLayer(strip,
+                    pygame.Rect(0, top, width, height), layer_object["parallax"]))
+        return scenery.ScrollingBackground(self.main_image, layers)
 
 class Sprite(pygame.sprite.Sprite):
     def __init__(self):
         super().__init__()
         self.actor = None
+        # The events.GameEventsManager of the game this sprite is in
+        self.events = None
 
     def set_actor(self, actor):
         self.actor = actor
+        # Nothing to interpolate from yet
+        actor.previous_position.set_from(actor.state.position)
         self.rect.topleft = self.actor.state.position.to_tuple()
 
     @staticmethod
     def load_images(path):
-        img = pygame.image.load(path)
-        img.convert_alpha()
-        return img
+        return AssetManager.image(path)
 
-    def update(self):
-        self.actor.update()
+    def update(self, dt):
+        self.actor.update(dt)
         # Update current position
         self.rect.topleft = self.actor.state.position.to_tuple()
 
@@ -109,90 +430,123 @@ class Sprite(pygame.sprite.Sprite):
 
 class SealSprite(Sprite):
     ASSET_NAME = "seal"
-    def __init__(self, asset_loader):
+    # Only the front third of the seal can eat or get eaten
+    MASK_FRONT_FRACTION = 1 / 3.0
+    def __init__(self, asset_loader, events_manager):
         super().__init__()
+        self.events = events_manager
         asset_object = asset_loader.asset_object[self.ASSET_NAME]
         self.asset_dir = asset_object["directory"]
         self.sprite_path = asset_object["sprite"]
+        self.scale = atlas.sprite_scale(asset_object)
         self.main_image = self.load_images(self.sprite_path)
         self.rect = self.main_image.get_rect() 
 
         # Load all animations from chomp
         chomp_images = [self.load_images(x) for x in
                 asset_object["animations"]["chomp"]]
-        self.chomp = Animation(chomp_images, 10)
+        # Each frame shows for 10 ticks at 120 ticks per second
+        self.chomp = Animation(chomp_images, 10 / 120.0)
 
         # Setting a different variable so that we can update the image with
         # animations later
         self.image = self.main_image
-        # Set collision box to front quarter of the seal
-        new_rect = self.image.get_rect().copy()
-        new_rect.width /= 3
-        new_rect.topright = self.image.get_rect().topright
-        cropped_surface = self.image.subsurface(new_rect)
-        full_size_surface = pygame.Surface([self.image.get_rect().width,
-            self.image.get_rect().height], pygame.SRCALPHA)
-        full_size_surface = full_size_surface.convert_alpha()
-        full_size_surface.blit(cropped_surface, new_rect)
-        self.mask = pygame.mask.from_surface(full_size_surface)
+        # Set collision box to front third of the seal, every animation
+        # frame has its own mask, all of them built once per process
+        self.set_image(self.main_image)
 
         self.current_animation = None
+        # Start chomping as soon as a fish gets eaten, instead of polling
+        self.events.subscribe("ate_fish", self.start_chomp)
 
-    def load_images(self, raw_path):
-        img = Sprite.load_images(os.path.join(self.asset_dir, raw_path))
+    def start_chomp(self, event):
+        self.chomp.active = True
 
-        # Resize to half the size
-        img = pygame.transform.rotozoom(img, 0, 0.5)
-        return img
+    def set_image(self, image):
+        self.image = image
+        self.mask, self.mask_bounds = AssetManager.mask(image,
+                self.MASK_FRONT_FRACTION)
 
-    def update(self):
-        """ Custom update function to take care of seal animations."""
-        super().update()
+    def load_images(self, raw_path):
+        # Resize to the scale in the asset list
+        return AssetManager.image(os.path.join(self.asset_dir, raw_path), self.scale)
 
-        if events.GameEventsManager.peek("ate_fish"):
-            self.chomp.active = True
+    def update(self, dt):
+        """ Custom update function to take care of seal animations."""
+        super().update(dt)
 
-        result = self.chomp.tick()
-        if result:
-            self.image = result
-        else:
-            self.image = self.main_image
+        result = self.chomp.tick(dt)
+        image = result if result else self.main_image
+        if image is not self.image:
+            self.set_image(image)
 
 
 class FishSprite(Sprite):
-    def __init__(self, main_image):
+    def __init__(self, main_image, pool = None, mask = None, mask_bounds = None):
         super().__init__()
         self.rect = main_image.get_rect() 
+        self.pool = pool
+        if mask is None:
+            mask, mask_bounds = AssetManager.mask(main_image)
+        self.mask = mask
+        self.mask_bounds = mask_bounds
 
         # Setting a different variable so that we can update the image with
         # animations later
         self.image = main_image
 
     def kill(self):
-        if not self.actor.delete:
+        if not self.alive():
+            return
+        if not self.actor.delete and self.events is not None:
             # We got eaten
-            events.GameEventsManager.notify_with_event(events.AteFishEvent())
+            self.events.notify_with_event(events.AteFishEvent())
+        if self.actor.world is not None:
+            self.actor.world.remove(self.actor)
         super().kill()
+        if self.pool is not None:
+            self.pool.release(self)
 
 class SharkSprite(FishSprite):
-    def __init__(self, main_image):
-        super().__init__(main_image)
+    def __init__(self, main_image, pool = None, mask = None, mask_bounds = None):
+        super().__init__(main_image, pool, mask, mask_bounds)
 
-class ChompAudioLoader(AssetLoader):
-    ASSET_NAME = "chomp_audio"
-    def __init__(self):
-        super().__init__()
-        chomp_object = self.asset_object[self.ASSET_NAME]
-        raw_path = chomp_object["ogg"]
-        ogg_path = os.path.join(chomp_object["directory"], raw_path)
-        self.audio = pygame.mixer.Sound(ogg_path)
-
-class BrrrAudioLoader(ChompAudioLoader):
-    ASSET_NAME = "brrr_audio"
-    def __init__(sefl):
-        super().__init__()
+class AudioLoader(AssetLoader):
+    """
+    A sound effect of the asset list. With a LoaderService, audio is a
+    PendingSound until the sound is decoded.
 
-class HappyBirthdayLoader(ChompAudioLoader):
-    ASSET_NAME = "happy_birthday"
-    def __init__(self):
+    """
+    def __init__(self, asset_name, service = None):
         super().__init__()
+        ogg_path = self.ogg_path(self.asset_object[asset_name])
+        if service is None:
+            self.audio = AssetManager.sound(ogg_path)
+        else:
+            future = service.sound(ogg_path)
+            self.audio = future.result() if future.done() else PendingSound(future)
+
+    @staticmethod
+    def ogg_path(audio_object):
+        return os.path.join(audio_object["directory"], audio_object["ogg"])
+
+    @staticmethod
+    def sound_effects(manifest):
+        """ Names of the sounds in the asset list that get decoded, not streamed """
+        return [name for name in sorted(manifest) if "ogg" in manifest[name] and
+                not manifest[name].get("music", False)]
+
+def preload(service):
+    """
+    Start loading everything a game needs on a LoaderService and return
+    (name, future) pairs. The sprites come out of the atlas, so a game can
+    be set up as soon as the atlas is ready, even if sounds are still
+    loading. The sounds need the mixer to be initialized, music is streamed
+    when it plays so it isn't loaded here.
+
+    """
+    manifest = AssetManager.get_manifest()
+    requests = [("sprite atlas", service.sprite_atlas())]
+    for name in AudioLoader.sound_effects(manifest):
+        requests.append((name, service.sound(AudioLoader.ogg_path(manifest[name]))))
+    return requests
@@ -1,6 +1,16 @@
 #!/bin/env python3
+"""
+Small geometry types used by the actors.
+
+The binary operators return new objects, the in-place operators and set()
+mutate the left hand side. Use copy() when a value has to be kept apart from
+the object it came from.
+
+"""
 
 class Vector:
+    __slots__ = ("x", "y")
+
     def __init__(self, x, y):
         self.x = x
         self.y = y
@@ -12,26 +22,86 @@ class Vector:
         return Vector(self.x + vec.x, self.y + vec.y)
 
     def __sub__(self, vec):
-        return self + (-vec)
+        return Vector(self.x - vec.x, self.y - vec.y)
+
+    def __mul__(self, scalar):
+        return Vector(self.x * scalar, self.y * scalar)
+
+    __rmul__ = __mul__
 
     def __iadd__(self, vec):
-        self = self + vec
+        self.x += vec.x
+        self.y += vec.y
         return self
 
     def __isub__(self, vec):
-        self += -vec
+        self.x -= vec.x
+        self.y -= vec.y
+        return self
+
+    def __imul__(self, scalar):
+        self.x *= scalar
+        self.y *= scalar
         return self
 
     def __str__(self):
         return "(" + str(self.x) + "," + str(self.y) + ")"
 
+    def __repr__(self):
+        return "Vector(" + repr(self.x) + ", " + repr(self.y) + ")"
+
+    def set(self, x, y):
+        """ Overwrite both components in place """
+        self.x = x
+        self.y = y
+        return self
+
+    def set_from(self, vec):
+        """ Copy the components of another vector into this one """
+        self.x = vec.x
+        self.y = vec.y
+        return self
+
+    def add_scaled(self, vec, scalar):
+        """ In place self += vec * scalar, without the temporary """
+        self.x += vec.x * scalar
+        self.y += vec.y * scalar
+        return self
+
+    def copy(self):
+        return Vector(self.x, self.y)
+
     def to_tuple(self):
         return (self.x, self.y)
 
 
+# Batch helpers, these mutate the vectors they are given
+
+def translate_all(vectors, offset):
+    """ Add the same offset to every vector """
+    dx = offset.x
+    dy = offset.y
+    for vec in vectors:
+        vec.x += dx
+        vec.y += dy
+
+def accumulate_all(vectors, deltas, scalar = 1):
+    """ vectors[i] += deltas[i] * scalar for each pair """
+    for vec, delta in zip(vectors, deltas):
+        vec.x += delta.x * scalar
+        vec.y += delta.y * scalar
+
+def scale_all(vectors, scalar):
+    for vec in vectors:
+        vec.x *= scalar
+        vec.y *= scalar
+
+
 class Rectangle:
+    __slots__ = ("top_right_corner", "size", "x1", "y1", "x2", "y2")
+
     def __init__(self, top_right_corner, size):
-        self.top_right_corner = top_right_corner 
+        self.top_right_corner = top_right_corner
         self.size = size
         self.x1 = top_right_corner.x
         self.y1 = top_right_corner.y
@@ -39,26 +109,47 @@ class Rectangle:
         self.y2 = top_right_corner.y + self.size.y
 
     def contains(self, rectangle):
-        x_intersects = False
-        y_intersects = False
-
-        # Check if x intersects
-        for x in [rectangle.x1, rectangle.x2]:
-            if x >= self.x1 and x <= self.x2:
-                x_intersects = True
-
-        for y in [rectangle.y1, rectangle.y2]:
-            if y >= self.y1 and y <= self.y2:
-                y_intersects = True
+        """
+        True if the two axis aligned boxes overlap. Like pygame.Rect the
+        boxes are half open, ones that only touch don't overlap.
+
+        """
+        return (rectangle.x1 < self.x2 and self.x1 < rectangle.x2 and
+                rectangle.y1 < self.y2 and self.y1 < rectangle.y2)
+
+    def set(self, x, y, width, height):
+        """ Move and resize the rectangle in place """
+        self.top_right_corner.set(x, y)
+        self.size.set(width, height)
+        self.x1 = x
+        self.y1 = y
+        self.x2 = x + width
+        self.y2 = y + height
+        return self
 
-        return x_intersects and y_intersects
+    def copy(self):
+        return Rectangle(self.top_right_corner.copy(), self.size.copy())
 
 
 class State:
-    def __init__(self, position = Vector(0,0), velocity = Vector(0,0), acceleration = Vector(0,0)):
-        self.position = position
-        self.velocity = velocity
-        self.acceleration = acceleration
+    __slots__ = ("position", "velocity", "acceleration")
+
+    def __init__(self, position = None, velocity = None, acceleration = None):
+        """ Every state gets its own vectors unless they are passed in """
+        self.position = position if position is not None else Vector(0,0)
+        self.velocity = velocity if velocity is not None else Vector(0,0)
+        self.acceleration = acceleration if acceleration is not None else Vector(0,0)
 
     def __str__(self):
         return "[" + "p:" + str(self.position) + "," + "v:" + str(self.velocity) + "," + "a:" + str(self.acceleration) + "]"
+
+    def copy(self):
+        return State(self.position.copy(), self.velocity.copy(),
+                self.acceleration.copy())
+
+    def set_from(self, state):
+        """ Copy another state into this one without replacing the vectors """
+        self.position.set_from(state.position)
+        self.velocity.set_from(state.velocity)
+        self.acceleration.set_from(state.acceleration)
+        return self
@@ -1,84 +1,239 @@
 #!/bin/env python3
 
-import pygame
+# First, so that the startup timeline covers the imports below
+import startup
+
+import argparse
+import os
 import functools
+import random
+
+with startup.timeline.span("import", "pygame"):
+    import pygame
 
-import actor
-import config
-import events
-import game_assets
-import geometry
+with startup.timeline.span("import", "game modules"):
+    import actor
+    import config
+    import events
+    import game_assets
+    import geometry
+    import profiler
+    import render
+    import spawner
 
-import controller
+    import controller
 
 """ This is the main file for the game.  """
 
-def setup(screen):
+def setup(screen, rng = None, loader_service = None, governor = None):
+    """
+    Set up a new game. Npcs spawn from NpcCreator.tick(), with an rng the
+    game can be replayed from its seed. With a game_assets.LoaderService,
+    assets that are still loading get placeholders instead of blocking. A
+    spawner.SpawnGovernor limits the npcs when frames get slow. screen can
+    be None if there's no display surface to draw on.
+
+    """
     # Load assets
     fish_loader = game_assets.FishLoader()
     shark_loader = game_assets.SharkLoader()
-    background_loader = game_assets.BackgroundLoader()
+    background_loader = game_assets.BackgroundLoader(loader_service)
 
     # Create an actor controller
     actor_controller = controller.ActorController(geometry.Vector(0,0),
-            geometry.Vector(config.ScreenInfo.width, config.ScreenInfo.height))
+            geometry.Vector(config.ScreenInfo.width, config.ScreenInfo.height),
+            loader_service = loader_service)
 
     game_controller = controller.GameController(actor_controller,
-            background_loader)
+            background_loader, loader_service)
 
     # Create a npc creator
-    creator = controller.NpcCreator(fish_loader, shark_loader, pygame.time.set_timer)
-
-    PROCESS_CUSTOM_EVENT = {
-            config.EVENT_MAPPING["CREATE_NEW_FISH"]: creator.create_fish,
-            config.EVENT_MAPPING["CREATE_NEW_SHARK"]: creator.create_shark,
-    }
+    creator = controller.NpcCreator(fish_loader, shark_loader,
+            actor_controller.events, rng = rng,
+            tick_rate = config.EngineInfo.tick_rate, governor = governor)
 
     # Fill in background
-    screen.blit(background_loader.main_image,
-            pygame.Rect(0,0,config.ScreenInfo.width,
-                config.ScreenInfo.height))
-
-    return (game_controller, PROCESS_CUSTOM_EVENT)
+    if screen is not None:
+        screen.blit(background_loader.main_image,
+                pygame.Rect(0,0,config.ScreenInfo.width,
+                    config.ScreenInfo.height))
+
+    return (game_controller, creator)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Smol Seal go CHOMP")
+    parser.add_argument("--profile", action="store_true",
+            help="Show the per stage frame time overlay")
+    parser.add_argument("--profile-export", metavar="PATH",
+            help="Write per frame stage timings to a .csv or .jsonl file")
+    parser.add_argument("--profile-history", type=int, default=240,
+            help="Number of frames kept for the overlay")
+    parser.add_argument("--record", metavar="PATH",
+            help="Record the inputs of each game to a replay log, see replay.py")
+    parser.add_argument("--seed", type=int,
+            help="Seed for recorded games, random by default")
+    parser.add_argument("--fps", type=int,
+            help="Frames rendered per second, 0 for uncapped. The game runs "
+            "at the same speed either way")
+    parser.add_argument("--profile-startup", action="store_true",
+            help="Print where the time to the first frame goes")
+    parser.add_argument("--renderer", choices=("software", "texture"),
+            default=config.EngineInfo.renderer,
+            help="Draw with surface blits or through an SDL renderer")
+    parser.add_argument("--render-driver", metavar="NAME",
+            help="SDL render driver for the texture renderer, e.g. opengl")
+    return parser.parse_args()
+
+def start_recording(args, game_index):
+    """ Returns the rng and the replay.Recorder for one recorded game """
+    # Only needed when recording
+    import replay
+    seed = args.seed if args.seed is not None else random.getrandbits(62)
+    seed += game_index
+    path = args.record
+    if game_index:
+        base, extension = os.path.splitext(path)
+        path = base + "-" + str(game_index + 1) + extension
+    return random.Random(seed), replay.Recorder(path, seed,
+            config.EngineInfo.tick_rate)
+
+def draw_frame(renderer, game_controller, alpha = 1.0, frame_profiler = profiler.NULL_PROFILER):
+    renderer.present(renderer.draw(game_controller, alpha, frame_profiler))
+
+def preload(renderer, loading_controller, loader_service, clock):
+    """
+    Load the rest of pygame, then keep the start screen up while the loader
+    service decodes the game assets. Returns once the sprites are ready,
+    sounds may still be loading. Returns False if the window got closed.
+
+    """
+    with startup.timeline.span("preload", "pygame"):
+        pygame.init()
+    sprite_atlas = game_assets.preload(loader_service)[0][1]
+    while not sprite_atlas.done():
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return False
+        loader_service.poll()
+        loading_controller.update()
+        draw_frame(renderer, loading_controller)
+        clock.tick(120)
+    return True
 
 def main():
     """ This is the main function that runs everything else in the game. """
-    pygame.init()
-    config.ScreenInfo.font = pygame.font.Font("freesansbold.ttf", 24)
-    screen = pygame.display.set_mode(config.ScreenInfo.size)
-
-    seal_icon = pygame.image.load("assets/seal.ico").convert_alpha()
-    pygame.display.set_caption("Smol Seal go CHOMP")
-    pygame.display.set_icon(seal_icon)
-
-    game_controller, PROCESS_CUSTOM_EVENT = setup(screen)
+    args = parse_args()
+    timeline = startup.timeline
+
+    # Only what the start screen needs comes before the first frame
+    with timeline.span("init", "display"):
+        pygame.display.init()
+        renderer = render.create(args.renderer, config.ScreenInfo.size,
+                "Smol Seal go CHOMP", args.render_driver)
+        seal_icon = pygame.image.load("assets/seal.ico").convert_alpha()
+        renderer.set_icon(seal_icon)
+    with timeline.span("asset", "font"):
+        pygame.font.init()
+        config.ScreenInfo.font = pygame.font.Font("freesansbold.ttf", 24)
+    # Everything else loads on worker threads
+    loader_service = game_assets.LoaderService(timeline = timeline)
+    loading_controller = controller.GameController(None,
+            game_assets.BackgroundLoader(loader_service))
+    with timeline.span("draw", "start screen"):
+        loading_controller.update()
+        draw_frame(renderer, loading_controller)
+    timeline.first_frame()
 
     clock = pygame.time.Clock()
+    if not preload(renderer, loading_controller, loader_service, clock):
+        loader_service.shutdown()
+        return
+    timeline.ready()
+    if args.profile_startup:
+        print(timeline.report())
+
+    recorder = None
+    game_index = 0
+    rng = None
+    if args.record:
+        rng, recorder = start_recording(args, game_index)
+    # Recorded games must replay the same on any machine, so frame times
+    # can't change what spawns
+    governor = None if recorder is not None else spawner.SpawnGovernor()
+    game_controller, creator = setup(renderer.screen, rng, loader_service, governor)
+
+    frame_profiler = profiler.NULL_PROFILER
+    if args.profile or args.profile_export:
+        frame_profiler = profiler.FrameProfiler(args.profile_history,
+                args.profile_export, overlay = args.profile)
+    game_controller.set_profiler(frame_profiler)
+
+    # Fixed timestep, rendering draws between the last two ticks
+    timestep = 1.0 / config.EngineInfo.tick_rate
+    max_lag = config.EngineInfo.max_ticks_per_frame * timestep
+    lag = 0.0
+    render_fps = args.fps if args.fps is not None else config.EngineInfo.render_fps
 
     # Main loop, this runs continuously until the player decides to quit
     running = True
     while running:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
+        frame_profiler.begin_frame()
+        pygame_events = pygame.event.get()
+        for event in pygame_events:
+            # The texture renderer's window isn't the only one, closing it
+            # doesn't quit
+            if event.type in (pygame.QUIT, pygame.WINDOWCLOSE):
                 running = False
-                continue;
- 
-            # Process custom events
-            if event.type in PROCESS_CUSTOM_EVENT and game_controller.active():
-                PROCESS_CUSTOM_EVENT[event.type]()
-        game_controller.tick(screen)
+        # Swap in assets that finished loading
+        loader_service.poll()
+        frame_profiler.mark("events")
+
+        # Run as many fixed ticks as fit in the time since the last frame,
+        # the rest carries over to the next frame
+        lag = min(lag + clock.get_time() / 1e3, max_lag)
+        keys = pygame.key.get_pressed()
+        actor_controller = game_controller.actor_controller
+        while lag >= timestep and not game_controller.do_reset:
+            # Ticks run exactly like simulation.Simulation.step
+            if game_controller.active():
+                creator.tick(actor_controller.score, actor_controller.npc_count)
+            game_controller.update(keys, timestep)
+            if recorder is not None:
+                recorder.record(keys, game_controller)
+            lag -= timestep
+        dirty_rects = renderer.draw(game_controller, lag / timestep, frame_profiler)
+        frame_profiler.mark("draw")
 
         # FPS printout
         # fps = str(int(clock.get_fps()))
         # fps_text = config.ScreenInfo.font.render(fps, 1, pygame.Color("black"))
         # screen.blit(fps_text, (10,0))
 
-        # Set frame rate to 120
-        clock.tick(120)
-        pygame.display.update()
+        # Only push the parts of the screen that changed
+        renderer.present(dirty_rects)
+        frame_profiler.mark("display_update")
+        if frame_profiler.enabled:
+            frame_profiler.end_frame(game_controller.actor_controller.npc_count,
+                    len(pygame_events), game_controller.actor_controller.events.pending_count())
+
+        # Cap the frame rate, the ticks keep the game speed the same
+        clock.tick(render_fps)
+        if governor is not None:
+            governor.observe(clock.get_rawtime(), actor_controller.npc_count)
 
         if game_controller.do_reset:
-            game_controller, PROCESS_CUSTOM_EVENT = setup(screen)
+            if recorder is not None:
+                recorder.close()
+                game_index += 1
+                rng, recorder = start_recording(args, game_index)
+            game_controller, creator = setup(renderer.screen, rng, loader_service,
+                    governor)
+            game_controller.set_profiler(frame_profiler)
+
+    loader_service.shutdown()
+    frame_profiler.close()
+    if recorder is not None:
+        recorder.close()
 
 
 if __name__=="__main__":
@@ -0,0 +1,163 @@
+#!/bin/env python3
+""" Structure-of-arrays physics for npcs, stepped once per tick. """
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class NpcWorld:
+    """
+    Keeps the physics state of every npc in contiguous arrays.
+
+    Actors are added with add() and get a row in the arrays. step() runs the
+    same integrate/bounce/clamp/cull logic as NpcFish.update for all rows at
+    once, and each actor copies its own row back with read_back(). Like
+    there, only x is stepped, npcs are inside their bounds vertically from
+    the start and never move up or down.
+
+    """
+    INITIAL_CAPACITY = 64
+
+    def __init__(self, capacity = INITIAL_CAPACITY):
+        self.count = 0
+        self.actors = []
+        self._allocate(capacity)
+
+    @staticmethod
+    def available():
+        return numpy is not None
+
+    def _allocate(self, capacity):
+        old_arrays = self._arrays() if self.count else ()
+
+        self.capacity = capacity
+        self.position = numpy.zeros((capacity, 2))
+        self.previous_position = numpy.zeros((capacity, 2))
+        self.velocity = numpy.zeros((capacity, 2))
+        self.acceleration = numpy.zeros((capacity, 2))
+        self.size = numpy.zeros((capacity, 2))
+        self.bmin = numpy.zeros((capacity, 2))
+        self.bmax = numpy.zeros((capacity, 2))
+        self.bounciness = numpy.zeros(capacity)
+        self.despawn_x = numpy.zeros(capacity)
+        self.delete = numpy.zeros(capacity, dtype=bool)
+
+        # Scratch buffers so that step() does not allocate
+        self._new_position = numpy.zeros((capacity, 2))
+        self._scaled = numpy.zeros((capacity, 2))
+        self._bounds_max = numpy.zeros((capacity, 2))
+        self._outside = numpy.zeros((capacity, 2), dtype=bool)
+        self._outside_max = numpy.zeros((capacity, 2), dtype=bool)
+
+        for old, new in zip(old_arrays, self._arrays()):
+            new[:self.count] = old[:self.count]
+
+    def _arrays(self):
+        return (self.position, self.previous_position, self.velocity,
+                self.acceleration, self.size,
+                self.bmin, self.bmax, self.bounciness, self.despawn_x, self.delete)
+
+    def add(self, actor):
+        """ Copy the actor into a new row. The actor bounds must be set. """
+        if self.count == self.capacity:
+            self._allocate(self.capacity * 2)
+
+        row = self.count
+        state = actor.state
+        self.position[row] = state.position.to_tuple()
+        self.previous_position[row] = actor.previous_position.to_tuple()
+        self.velocity[row] = state.velocity.to_tuple()
+        self.acceleration[row] = state.acceleration.to_tuple()
+        self.size[row] = actor.size.to_tuple()
+        self.bmin[row] = actor.bmin.to_tuple()
+        self.bmax[row] = actor.bmax.to_tuple()
+        self.bounciness[row] = actor.bounciness
+        self.despawn_x[row] = actor.despawn_x
+        self.delete[row] = actor.delete
+
+        actor.world = self
+        actor.world_index = row
+        self.actors.append(actor)
+        self.count += 1
+
+    def remove(self, actor):
+        """ Free the actor's row by moving the last row into it. """
+        row = actor.world_index
+        last = self.count - 1
+        if row != last:
+            for array in self._arrays():
+                array[row] = array[last]
+            moved = self.actors[last]
+            moved.world_index = row
+            self.actors[row] = moved
+        self.actors.pop()
+        self.count = last
+
+        actor.world = None
+        actor.world_index = None
+
+    def clear(self):
+        for actor in self.actors:
+            actor.world = None
+            actor.world_index = None
+        self.actors = []
+        self.count = 0
+
+    def step(self, dt):
+        """ Vectorized version of NpcFish.update """
+        n = self.count
+        if n == 0:
+            return
+
+        x = self.position[:n, 0]
+        velocity_x = self.velocity[:n, 0]
+        scaled = self._scaled[:n, 0]
+        new_x = self._new_position[:n, 0]
+        max_x = self._bounds_max[:n, 0]
+        bmin_x = self.bmin[:n, 0]
+        outside = self._outside[:n, 0]
+        outside_max = self._outside_max[:n, 0]
+
+        self.previous_position[:n, 0] = x
+        numpy.multiply(self.acceleration[:n, 0], dt, out=scaled)
+        velocity_x += scaled
+        numpy.multiply(velocity_x, dt, out=scaled)
+        numpy.add(x, scaled, out=new_x)
+
+        # Correct bounds for actor size
+        numpy.subtract(self.bmax[:n, 0], self.size[:n, 0], out=max_x)
+
+        # Bounciness behaviour
+        numpy.greater(new_x, max_x, out=outside_max)
+        numpy.less(new_x, bmin_x, out=outside)
+        outside |= outside_max
+        numpy.multiply(self.bounciness[:n], velocity_x, out=scaled)
+        numpy.negative(scaled, out=scaled)
+        numpy.copyto(velocity_x, scaled, where=outside)
+
+        # Bound the position
+        numpy.minimum(new_x, max_x, out=new_x)
+        numpy.maximum(new_x, bmin_x, out=x)
+
+        # Delete once off screen or at the edge
+        delete = self.delete[:n]
+        numpy.add(x, self.size[:n, 0], out=scaled)
+        delete |= scaled <= self.despawn_x[:n]
+        delete |= x <= bmin_x
+
+    def read_back(self, actor):
+        """ Copy the actor's row back into its state """
+        row = actor.world_index
+        position = self.position[row]
+        previous = self.previous_position[row]
+        velocity = self.velocity[row]
+        state = actor.state
+        actor.previous_position.x = float(previous[0])
+        actor.previous_position.y = float(previous[1])
+        state.position.x = float(position[0])
+        state.position.y = float(position[1])
+        state.velocity.x = float(velocity[0])
+        state.velocity.y = float(velocity[1])
+        actor.delete = bool(self.delete[row])
@@ -0,0 +1,199 @@
+#!/bin/env python3
+"""
+Per stage frame profiler.
+
+The game calls begin_frame() at the start of each frame, mark(stage) at the
+end of each stage and end_frame() once the frame is on screen. The time
+between two marks is charged to the stage named by the second one. Frames
+are kept in a ring buffer, can be drawn as an overlay and can be exported
+to a CSV or JSONL file.
+
+NULL_PROFILER has the same interface and does nothing, it's what the
+controllers use unless a real profiler is attached.
+
+"""
+
+import collections
+import json
+import time
+
+import pygame
+
+import config
+
+STAGES = (
+    "events",
+    "listen_to_events",
+    "collision",
+    "sprite_update",
+    "score",
+    "draw",
+    "display_update",
+)
+
+
+class NullProfiler:
+    """ Profiler that does nothing, so that the hooks cost next to nothing """
+    enabled = False
+    overlay_rect = None
+
+    def begin_frame(self):
+        pass
+
+    def mark(self, stage):
+        pass
+
+    def end_frame(self, npcs = 0, pygame_events = 0, game_events = 0):
+        pass
+
+    def draw_overlay(self, screen):
+        return None
+
+    def close(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class FrameSample:
+    __slots__ = ("frame", "total", "stages", "npcs", "pygame_events", "game_events")
+
+    def __init__(self, frame, total, stages, npcs, pygame_events, game_events):
+        self.frame = frame
+        self.total = total
+        self.stages = stages
+        self.npcs = npcs
+        self.pygame_events = pygame_events
+        self.game_events = game_events
+
+    def to_dict(self):
+        row = {"frame": self.frame, "total_ms": self.total * 1e3}
+        for name, seconds in zip(STAGES, self.stages):
+            row[name + "_ms"] = seconds * 1e3
+        row["npcs"] = self.npcs
+        row["pygame_events"] = self.pygame_events
+        row["game_events"] = self.game_events
+        return row
+
+
+class FrameExporter:
+    """ Writes one row per frame, JSONL if the path ends in .jsonl else CSV """
+    def __init__(self, path):
+        self.jsonl = path.endswith(".jsonl")
+        self.file = open(path, "w")
+        if not self.jsonl:
+            columns = ["frame", "total_ms"] + [x + "_ms" for x in STAGES]
+            columns += ["npcs", "pygame_events", "game_events"]
+            self.file.write(",".join(columns) + "\n")
+
+    def write(self, sample):
+        row = sample.to_dict()
+        if self.jsonl:
+            self.file.write(json.dumps(row) + "\n")
+        else:
+            self.file.write(",".join(str(round(x, 4)) for x in row.values()) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class FrameProfiler:
+    enabled = True
+    OVERLAY_SIZE = (300, 150)
+    # Frame budget drawn as a line on the graph
+    BUDGET_MS = 1e3 / 120
+
+    def __init__(self, history = 240, export_path = None, overlay = False):
+        self.frames = collections.deque(maxlen = history)
+        self.frame_count = 0
+        self.overlay = overlay
+        # Where the overlay was last drawn, the game erases it from there
+        self.overlay_rect = None
+        self.exporter = FrameExporter(export_path) if export_path else None
+
+        self._stage_index = {name: i for i, name in enumerate(STAGES)}
+        self._current = [0.0] * len(STAGES)
+        self._frame_start = self._last = time.perf_counter()
+        self._font = None
+
+    def begin_frame(self):
+        self._current = [0.0] * len(STAGES)
+        self._frame_start = self._last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self._current[self._stage_index[stage]] += now - self._last
+        self._last = now
+
+    def end_frame(self, npcs = 0, pygame_events = 0, game_events = 0):
+        total = time.perf_counter() - self._frame_start
+        sample = FrameSample(self.frame_count, total, self._current, npcs,
+                pygame_events, game_events)
+        self.frames.append(sample)
+        self.frame_count += 1
+        if self.exporter:
+            self.exporter.write(sample)
+
+    def stage_means(self):
+        """ Mean seconds per stage over the frames in the ring buffer """
+        if not self.frames:
+            return dict.fromkeys(STAGES, 0.0)
+        sums = [0.0] * len(STAGES)
+        for sample in self.frames:
+            for i, seconds in enumerate(sample.stages):
+                sums[i] += seconds
+        return {name: x / len(self.frames) for name, x in zip(STAGES, sums)}
+
+    def slowest_stage(self):
+        means = self.stage_means()
+        return max(means, key = means.get)
+
+    def draw_overlay(self, screen):
+        """ Draw the frame time graph and counters, returns the rect drawn """
+        if not self.overlay or not self.frames:
+            return None
+        if self._font is None:
+            self._font = pygame.font.Font("freesansbold.ttf", 12)
+
+        width, height = self.OVERLAY_SIZE
+        rect = pygame.Rect(10, 10, width, height)
+        # Opaque, so that redrawing it over itself every frame looks the same
+        panel = pygame.Surface(self.OVERLAY_SIZE)
+        panel.fill(config.Color["black"])
+
+        # Frame time graph, the budget line sits at half the height
+        graph_height = 70
+        scale = graph_height / (2 * self.BUDGET_MS)
+        budget_y = graph_height - int(self.BUDGET_MS * scale)
+        pygame.draw.line(panel, config.Color["green"], (0, budget_y), (width, budget_y))
+        step = width / float(self.frames.maxlen)
+        for i, sample in enumerate(self.frames):
+            bar = min(graph_height, int(sample.total * 1e3 * scale))
+            color = config.Color["red"] if sample.total * 1e3 > self.BUDGET_MS else config.Color["white"]
+            x = int(i * step)
+            pygame.draw.line(panel, color, (x, graph_height), (x, graph_height - bar))
+
+        last = self.frames[-1]
+        means = self.stage_means()
+        lines = [
+            "frame %.2f ms  npcs %d  events %d/%d" % (last.total * 1e3,
+                last.npcs, last.pygame_events, last.game_events),
+            "  ".join("%s %.2f" % (name[:6], means[name] * 1e3) for name in STAGES[:4]),
+            "  ".join("%s %.2f" % (name[:6], means[name] * 1e3) for name in STAGES[4:]),
+            "slowest: " + self.slowest_stage(),
+        ]
+        y = graph_height + 4
+        for line in lines:
+            text = self._font.render(line, True, config.Color["white"])
+            panel.blit(text, (4, y))
+            y += 18
+
+        screen.blit(panel, rect)
+        self.overlay_rect = rect
+        return rect
+
+    def close(self):
+        if self.exporter:
+            self.exporter.close()
+            self.exporter = None
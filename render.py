@@ -0,0 +1,244 @@
+#!/bin/env python3
+"""
+Render backends, selected with config.EngineInfo.renderer or --renderer.
+
+SoftwareRenderer draws the way the game always has, Surface blits onto the
+display surface and only the dirty rects pushed to the window.
+TextureRenderer uploads every image once as a pygame._sdl2.video.Texture
+and draws whole frames through an SDL Renderer, so the blitting happens on
+the GPU if there is one. create() falls back to the software renderer when
+pygame._sdl2 isn't there or no SDL renderer can be made.
+
+The texture renderer also runs on SDL's software render driver, which
+works with the dummy video driver, so both can be compared headless:
+
+    python render.py --driver software --ticks 1500
+
+"""
+
+import argparse
+import time
+import weakref
+
+import pygame
+
+try:
+    from pygame._sdl2 import video
+except ImportError:
+    video = None
+
+import config
+import profiler
+
+
+class SoftwareRenderer:
+    """ Surface blits onto the display surface """
+    name = "software"
+
+    def __init__(self, screen):
+        self.screen = screen
+
+    @classmethod
+    def create(cls, size = None, title = ""):
+        screen = pygame.display.set_mode(size or config.ScreenInfo.size)
+        pygame.display.set_caption(title)
+        return cls(screen)
+
+    def set_icon(self, icon):
+        pygame.display.set_icon(icon)
+
+    def draw(self, game_controller, alpha = 1.0, frame_profiler = profiler.NULL_PROFILER):
+        """ Draw a frame, returns the rects that changed """
+        dirty_rects = game_controller.draw(self.screen, alpha)
+        overlay_rect = frame_profiler.draw_overlay(self.screen)
+        if overlay_rect:
+            dirty_rects.append(overlay_rect)
+        return dirty_rects
+
+    def present(self, dirty_rects):
+        pygame.display.update(dirty_rects)
+
+    def to_surface(self):
+        return self.screen.copy()
+
+
+class TextureRenderer:
+    """
+    Draws through a pygame._sdl2.video.Renderer in a window of its own.
+
+    Each surface is uploaded the first time it's drawn. Subsurfaces, like
+    the sprite images cut out of the atlas, are drawn out of the texture of
+    the surface they belong to, so the whole atlas is a single texture.
+    Textures go away with their surfaces.
+
+    There's no display surface to draw on, screen is None. Every frame is
+    drawn in full, there are no dirty rects.
+
+    """
+    name = "texture"
+    BACKGROUND = (0, 0, 0, 255)
+
+    def __init__(self, window, renderer):
+        self.screen = None
+        self.window = window
+        self.renderer = renderer
+        # Surface -> Texture
+        self.textures = weakref.WeakKeyDictionary()
+        self.uploads = 0
+
+    @staticmethod
+    def available():
+        return video is not None
+
+    @classmethod
+    def create(cls, size = None, title = "", driver = None):
+        """
+        Open a window with a Renderer on the named SDL render driver, the
+        best one there is by default. Raises if that fails.
+
+        """
+        if video is None:
+            raise ImportError("pygame._sdl2 isn't available")
+        index = -1
+        if driver is not None:
+            names = [x.name for x in video.get_drivers()]
+            if driver not in names:
+                raise ValueError("No %s render driver, there's %s" % (driver,
+                    ", ".join(names)))
+            index = names.index(driver)
+
+        # Images still get converted to the display format, which needs a
+        # display mode. Its window stays hidden, the game has its own
+        pygame.display.set_mode((1, 1), pygame.HIDDEN)
+        window = video.Window(title, size = size or config.ScreenInfo.size)
+        return cls(window, video.Renderer(window, index = index))
+
+    def set_icon(self, icon):
+        self.window.set_icon(icon)
+
+    def texture(self, surface):
+        """ The texture surface is in and where in it, None if it's all of it """
+        parent = surface.get_abs_parent()
+        texture = self.textures.get(parent)
+        if texture is None:
+            texture = self.textures[parent] = video.Texture.from_surface(self.renderer, parent)
+            self.uploads += 1
+        if parent is surface:
+            return texture, None
+        return texture, pygame.Rect(surface.get_abs_offset(), surface.get_size())
+
+    def blit(self, surface, dest, area = None):
+        """
+        Like Surface.blit, so drawing code written for surfaces can draw
+        through this. Returns the rect drawn.
+
+        """
+        texture, source = self.texture(surface)
+        if area is not None:
+            area = pygame.Rect(area)
+            if source is not None:
+                area.move_ip(source.topleft)
+            source = area
+        size = source.size if source is not None else surface.get_size()
+        rect = pygame.Rect((dest[0], dest[1]), size)
+        texture.draw(srcrect = source, dstrect = rect)
+        return rect
+
+    def draw(self, game_controller, alpha = 1.0, frame_profiler = profiler.NULL_PROFILER):
+        """ Draw a whole frame, alpha of the way into the next tick """
+        self.renderer.draw_color = self.BACKGROUND
+        self.renderer.clear()
+
+        scenery = game_controller.background_loader.scenery
+        self.blit(scenery.image, (0, 0))
+        for layer in scenery.layers:
+            self.blit(layer.strip, layer.rect, layer.area())
+
+        actor_controller = game_controller.actor_controller
+        if actor_controller is not None and game_controller.mode != game_controller.MODE[0]:
+            for group in (actor_controller.player_sprite_group,
+                    actor_controller.fish_sprite_group,
+                    actor_controller.shark_sprite_group):
+                for sprite in group:
+                    if alpha >= 1.0:
+                        self.blit(sprite.image, sprite.rect)
+                    else:
+                        self.blit(sprite.image, sprite.actor.interpolated_position(alpha))
+            actor_controller.draw_score(self)
+
+        for text, text_rect in game_controller.screen_text():
+            self.blit(text, text_rect)
+        frame_profiler.draw_overlay(self)
+        return None
+
+    def present(self, dirty_rects = None):
+        self.renderer.present()
+
+    def to_surface(self):
+        """ Read the frame back, slow """
+        return self.renderer.to_surface()
+
+
+def create(name = None, size = None, title = "", driver = None):
+    """ The renderer called name, the software one if it can't be made """
+    name = name or config.EngineInfo.renderer
+    if name == TextureRenderer.name:
+        try:
+            return TextureRenderer.create(size, title, driver)
+        except (ImportError, ValueError, RuntimeError, pygame.error) as error:
+            print("Not using the texture renderer: " + str(error))
+    return SoftwareRenderer.create(size, title)
+
+
+def compare(left, right):
+    """ Pixels that differ between two surfaces and the largest difference """
+    left = pygame.image.tobytes(left, "RGB")
+    right = pygame.image.tobytes(right, "RGB")
+    differences = [abs(a - b) for a, b in zip(left, right) if a != b]
+    pixels = sum(1 for i in range(0, len(left), 3) if left[i:i + 3] != right[i:i + 3])
+    return pixels, max(differences or [0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the renderers headless")
+    parser.add_argument("--driver", default="software",
+            help="SDL render driver of the texture renderer")
+    parser.add_argument("--seed", type=int, default=3)
+    parser.add_argument("--ticks", type=int, default=1500,
+            help="Ticks to play before drawing")
+    parser.add_argument("--frames", type=int, default=500,
+            help="Frames drawn by each renderer for the timing")
+    args = parser.parse_args()
+
+    # Only needed for comparing
+    import simulation
+    simulation.init_headless()
+    software = SoftwareRenderer(pygame.Surface(config.ScreenInfo.size).convert())
+    texture = TextureRenderer.create(driver = args.driver)
+
+    game = simulation.Simulation(args.seed, screen = software.screen)
+    game.run(args.ticks)
+    game_controller = game.game_controller
+    game_controller.full_redraw = True
+    software.draw(game_controller)
+    texture.draw(game_controller)
+    pixels, largest = compare(software.to_surface(), texture.to_surface())
+    print("%d npcs at tick %d, %d pixels differ, by %d at most" % (
+        game.actor_controller.npc_count, game.ticks, pixels, largest))
+
+    for renderer in (software, texture):
+        start = time.perf_counter()
+        for i in range(args.frames):
+            game_controller.full_redraw = True
+            renderer.draw(game_controller)
+            if renderer is texture:
+                renderer.present()
+        elapsed = time.perf_counter() - start
+        print("  %-8s %7.3f ms per full frame" % (renderer.name,
+            elapsed / args.frames * 1e3))
+    print("%d textures uploaded" % texture.uploads)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,200 @@
+#!/bin/env python3
+"""
+Input recording and deterministic replay.
+
+A replay log is the seed of a game plus one input bitmask per tick, and
+optionally a checksum of the game state after each tick. Because spawns are
+counted in ticks and drawn from the seeded rng, that's all it takes to run
+the exact same game again. Replays run headless as fast as possible and can
+save screenshots of chosen ticks.
+
+    python main.py --record game.seal
+    python replay.py game.seal --render-ticks 600 1200 --render-dir shots
+
+Log format, little endian:
+
+    header  4s magic, B version, B flags, H tick rate, q seed
+    ticks   B input bitmask, followed by I checksum if FLAG_CHECKSUMS
+
+"""
+
+import argparse
+import array
+import os
+import struct
+import time
+import zlib
+
+import pygame
+
+import config
+import simulation
+
+MAGIC = b"SEAL"
+# Version 2 has physics in per second units, version 3 despawns npcs as
+# soon as they leave the screen. Older logs replay differently
+VERSION = 3
+HEADER = struct.Struct("<4sBBHq")
+FLAG_CHECKSUMS = 1
+
+# Bit i of the input bitmask is KEYS[i]
+KEYS = (pygame.K_SPACE, pygame.K_s)
+
+
+def keys_to_bits(keys):
+    """ Bitmask from anything indexable like pygame.key.get_pressed() """
+    bits = 0
+    for i, key in enumerate(KEYS):
+        if keys[key]:
+            bits |= 1 << i
+    return bits
+
+
+def bits_to_keys(bits):
+    return [key for i, key in enumerate(KEYS) if bits & (1 << i)]
+
+
+def state_checksum(game_controller):
+    """ crc32 of the parts of the game state that matter for determinism """
+    actor_controller = game_controller.actor_controller
+    state = actor_controller.player.actor.state
+    values = array.array("d", (state.position.x, state.position.y,
+        state.velocity.x, state.velocity.y,
+        state.acceleration.x, state.acceleration.y))
+    for group in (actor_controller.fish_sprite_group, actor_controller.shark_sprite_group):
+        for sprite in group:
+            position = sprite.actor.state.position
+            values.append(position.x)
+            values.append(position.y)
+
+    header = struct.pack("<iBI", actor_controller.score,
+            game_controller.MODE.index(game_controller.mode),
+            actor_controller.npc_count)
+    return zlib.crc32(values.tobytes(), zlib.crc32(header))
+
+
+class Recorder:
+    """ Writes a replay log tick by tick, so a crash still leaves a usable log """
+    def __init__(self, path, seed, tick_rate = 120, checksums = True):
+        self.file = open(path, "wb")
+        self.checksums = checksums
+        self.ticks = 0
+        self.file.write(HEADER.pack(MAGIC, VERSION,
+            FLAG_CHECKSUMS if checksums else 0, tick_rate, seed))
+
+    def record(self, keys, game_controller = None):
+        """ Call once per tick, after the tick has run """
+        if self.checksums:
+            self.file.write(struct.pack("<BI", keys_to_bits(keys),
+                state_checksum(game_controller)))
+        else:
+            self.file.write(struct.pack("<B", keys_to_bits(keys)))
+        self.ticks += 1
+
+    def close(self):
+        self.file.close()
+
+
+class ReplayLog:
+    def __init__(self, seed, tick_rate, inputs, checksums = None):
+        self.seed = seed
+        self.tick_rate = tick_rate
+        self.inputs = inputs
+        self.checksums = checksums
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as log_file:
+            data = log_file.read()
+        magic, version, flags, tick_rate, seed = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError(path + " is not a replay log")
+        if version != VERSION:
+            raise ValueError("Unsupported replay log version " + str(version))
+
+        body = data[HEADER.size:]
+        if flags & FLAG_CHECKSUMS:
+            # Ignore a partly written last record, e.g. after a crash
+            body = body[:len(body) - len(body) % 5]
+            records = list(struct.iter_unpack("<BI", body))
+            return cls(seed, tick_rate, array.array("B", (x[0] for x in records)),
+                    array.array("I", (x[1] for x in records)))
+        return cls(seed, tick_rate, array.array("B", body))
+
+
+class ReplayPolicy:
+    """ Input policy that plays back the recorded bitmasks """
+    def __init__(self, inputs):
+        self.inputs = inputs
+
+    def __call__(self, game):
+        if game.ticks < len(self.inputs):
+            return bits_to_keys(self.inputs[game.ticks])
+        return ()
+
+
+class ReplayMismatch(Exception):
+    pass
+
+
+def replay(log, verify = True, render_ticks = (), render_dir = None):
+    """
+    Run a replay log headless. Raises ReplayMismatch at the first tick whose
+    state checksum differs from the recorded one. Returns the simulation.
+
+    """
+    game = simulation.Simulation(log.seed, ReplayPolicy(log.inputs),
+            tick_rate = log.tick_rate, skip_start_screen = False)
+    render_ticks = set(render_ticks)
+    surface = pygame.Surface(config.ScreenInfo.size) if render_ticks else None
+    verify = verify and log.checksums is not None
+
+    for tick in range(len(log.inputs)):
+        render = tick in render_ticks
+        if render:
+            # Draw everything, the dirty rects of skipped ticks were never drawn
+            game.game_controller.full_redraw = True
+            game.screen = surface
+        game.step()
+        if render:
+            game.screen = None
+            pygame.image.save(surface, os.path.join(render_dir or ".",
+                "tick_%06d.png" % tick))
+
+        if verify and state_checksum(game.game_controller) != log.checksums[tick]:
+            raise ReplayMismatch("State differs from the recording at tick " + str(tick))
+    return game
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded game")
+    parser.add_argument("log")
+    parser.add_argument("--no-verify", action="store_true",
+            help="Don't compare the per tick state checksums")
+    parser.add_argument("--render-ticks", type=int, nargs="*", default=[],
+            help="Save a screenshot after each of these ticks")
+    parser.add_argument("--render-dir", default=".")
+    args = parser.parse_args()
+
+    log = ReplayLog.load(args.log)
+    if args.render_ticks:
+        os.makedirs(args.render_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    try:
+        game = replay(log, not args.no_verify, args.render_ticks, args.render_dir)
+    except ReplayMismatch as error:
+        print(error)
+        return 1
+    elapsed = time.perf_counter() - start
+
+    print("replayed %d ticks in %.2fs (%dx real time)" % (len(log.inputs), elapsed,
+        len(log.inputs) / float(log.tick_rate) / max(elapsed, 1e-9)))
+    print("score: %d, mode: %s" % (game.actor_controller.score, game.game_controller.mode))
+    if log.checksums is not None and not args.no_verify:
+        print("all checksums match")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
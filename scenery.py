@@ -0,0 +1,109 @@
+#!/bin/env python3
+"""
+Scrolling background made of horizontal parallax bands.
+
+The "layers" of the background in the asset list cut the image into bands,
+each with the fraction of the game speed it scrolls at. Every band is tiled
+once into a converted, opaque strip one tile wider than the screen, so the
+band at any scroll offset is a single blit out of it.
+
+Nothing gets recomposited per frame. A band that moved is shifted in place
+with Surface.scroll, and only the columns that scrolled in are blitted from
+its strip, both on the screen and on the copy of the background that
+sprites get erased from. The rest of the background never moves, so it
+keeps using dirty rects.
+
+"""
+
+import pygame
+
+
+def tile_strip(image, rect, width):
+    """
+    Opaque strip of the rect of image repeated side by side, at least width
+    plus one tile wide.
+
+    """
+    tile = image.subsurface(rect)
+    strip = pygame.Surface((width + rect.width, rect.height)).convert()
+    for x in range(0, strip.get_width(), rect.width):
+        strip.blit(tile, (x, 0))
+    return strip
+
+
+class ParallaxLayer:
+    """ One band of the screen that scrolls parallax times the game speed """
+    def __init__(self, strip, rect, parallax):
+        self.strip = strip
+        # Where the band is on screen, and how wide one tile of it is
+        self.rect = rect
+        self.tile_width = strip.get_width() - rect.width
+        self.parallax = parallax
+        # Pixels scrolled so far, and as of the last scroll()
+        self.offset = 0.0
+        self.drawn_offset = 0
+
+    def advance(self, distance):
+        self.offset += distance * self.parallax
+
+    def area(self):
+        """ The part of the strip that shows in the band at the offset """
+        return pygame.Rect(int(self.offset) % self.tile_width, 0, self.rect.width,
+                self.rect.height)
+
+    def scroll(self, surfaces):
+        """ Bring the band on each surface up to the offset, True if it moved """
+        offset = int(self.offset)
+        shift = offset - self.drawn_offset
+        if not shift:
+            return False
+        self.drawn_offset = offset
+
+        rect = self.rect
+        if 0 < shift < rect.width:
+            # Only the columns that scrolled in on the right are new
+            area = pygame.Rect((offset + rect.width - shift) % self.tile_width, 0,
+                    shift, rect.height)
+            destination = (rect.right - shift, rect.top)
+            for surface in surfaces:
+                surface.subsurface(rect).scroll(-shift, 0)
+                surface.blit(self.strip, destination, area)
+        else:
+            area = self.area()
+            for surface in surfaces:
+                surface.blit(self.strip, rect, area)
+        return True
+
+
+class ScrollingBackground:
+    """
+    The background of a game. surface is what the background looks like at
+    the last scroll, without layers it's the image itself and never changes.
+
+    """
+    def __init__(self, image, layers = ()):
+        self.image = image
+        self.layers = list(layers)
+        # The image is shared through the asset cache, only scroll a copy
+        self.surface = image.copy() if self.layers else image
+
+    def advance(self, distance):
+        """ Move the scenery by distance pixels at full game speed """
+        for layer in self.layers:
+            layer.advance(distance)
+
+    def scroll(self, screen):
+        """
+        Scroll the bands that moved on the screen and on surface, returns
+        their rects. The screen has to show surface apart from sprites that
+        have been erased already.
+
+        """
+        surfaces = (self.surface, screen) if screen is not None else (self.surface,)
+        return [x.rect for x in self.layers if x.scroll(surfaces)]
+
+    def draw(self, screen):
+        """ Repaint the whole screen, returns its rect """
+        self.scroll(None)
+        screen.blit(self.surface, (0, 0))
+        return screen.get_rect()
@@ -0,0 +1,210 @@
+#!/bin/env python3
+"""
+Headless, fixed timestep simulation of the game.
+
+This runs the same GameController/ActorController as main.py, but with the
+SDL dummy video and audio drivers, a seeded random number generator and
+spawns counted in ticks instead of wall clock timers. Every tick is one
+logical frame and the loop runs as fast as the CPU allows, so the same seed
+and inputs always give the same game.
+
+    python simulation.py --seed 3 --max-ticks 20000
+
+"""
+
+import argparse
+import os
+import random
+import time
+
+import pygame
+
+import config
+import controller
+import game_assets
+import geometry
+import snapshot
+
+
+def init_headless():
+    """ Initialize pygame with the dummy drivers, safe to call more than once """
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    pygame.init()
+    if config.ScreenInfo.font is None:
+        config.ScreenInfo.font = pygame.font.Font("freesansbold.ttf", 24)
+    # Images need a display mode before they can be converted
+    if pygame.display.get_surface() is None:
+        pygame.display.set_mode(config.ScreenInfo.size)
+    return pygame.display.get_surface()
+
+
+class FixedClock:
+    """ Stands in for pygame.time.Clock, time only moves when tick() is called """
+    def __init__(self, timestep):
+        self.timestep = timestep
+        self.ticks = 0
+
+    def tick(self, framerate = 0):
+        """ Advance one timestep without sleeping, returns milliseconds """
+        self.ticks += 1
+        return int(self.timestep * 1e3)
+
+    def get_time(self):
+        return int(self.timestep * 1e3)
+
+    def get_fps(self):
+        return 1.0 / self.timestep
+
+    @property
+    def elapsed(self):
+        """ Logical seconds since the clock was created """
+        return self.ticks * self.timestep
+
+
+class PressedKeys:
+    """ Looks like the result of pygame.key.get_pressed() for a set of keys """
+    def __init__(self, pressed = ()):
+        self.pressed = frozenset(pressed)
+
+    def __getitem__(self, key):
+        return key in self.pressed
+
+
+class RandomPolicy:
+    """ Presses SPACE on each tick with the given probability """
+    def __init__(self, seed = None, probability = 0.45):
+        self.rng = random.Random(seed)
+        self.probability = probability
+
+    def __call__(self, simulation):
+        if self.rng.random() < self.probability:
+            return (pygame.K_SPACE,)
+        return ()
+
+
+class PeriodicPolicy:
+    """ Holds SPACE for hold ticks out of every period ticks """
+    def __init__(self, period = 60, hold = 25):
+        self.period = period
+        self.hold = hold
+
+    def __call__(self, simulation):
+        if simulation.ticks % self.period < self.hold:
+            return (pygame.K_SPACE,)
+        return ()
+
+
+def never_press(simulation):
+    return ()
+
+
+class Simulation:
+    """
+    One headless game.
+
+    input_policy is called once per tick with the simulation and returns the
+    keys that are held down. If screen is given the game is drawn onto it,
+    otherwise nothing is rendered. Unless skip_start_screen is off the game
+    starts straight in PLAY mode.
+
+    """
+    TICK_RATE = config.EngineInfo.tick_rate
+
+    def __init__(self, seed = None, input_policy = None, clock = None,
+            tick_rate = TICK_RATE, screen = None, skip_start_screen = True):
+        init_headless()
+        self.skip_start_screen = skip_start_screen
+        self.seed = seed
+        self.tick_rate = tick_rate
+        self.timestep = 1.0 / tick_rate
+        self.clock = clock if clock is not None else FixedClock(self.timestep)
+        self.input_policy = input_policy if input_policy is not None else RandomPolicy(seed)
+        self.screen = screen
+        self.reset()
+
+    def reset(self):
+        self.rng = random.Random(self.seed)
+        self.ticks = 0
+
+        self.actor_controller = controller.ActorController(geometry.Vector(0,0),
+                geometry.Vector(config.ScreenInfo.width, config.ScreenInfo.height))
+        self.game_controller = controller.GameController(self.actor_controller,
+                game_assets.BackgroundLoader())
+        self.creator = controller.NpcCreator(game_assets.FishLoader(),
+                game_assets.SharkLoader(), self.actor_controller.events,
+                rng = self.rng, tick_rate = self.tick_rate)
+
+        if self.skip_start_screen:
+            self.game_controller.transition()
+
+    def done(self):
+        """ True once the seal got eaten """
+        return self.game_controller.mode == self.game_controller.MODE[2]
+
+    def step(self):
+        """ Run one fixed timestep """
+        self.advance(PressedKeys(self.input_policy(self)))
+
+    def advance(self, keys):
+        """ Run one fixed timestep with keys held, bypassing the input policy """
+        if self.game_controller.active():
+            self.creator.tick(self.actor_controller.score,
+                    self.actor_controller.npc_count)
+        self.game_controller.tick(self.screen, keys, self.timestep)
+        self.clock.tick(self.tick_rate)
+        self.ticks += 1
+
+    def snapshot(self, compress = False):
+        """ The game state as bytes, see snapshot.py """
+        return snapshot.capture(self.game_controller, self.creator, self.ticks,
+                compress)
+
+    def restore(self, data):
+        """
+        Carry on from a snapshot, which can come from another Simulation.
+        The input policy keeps its own state.
+
+        """
+        self.ticks = snapshot.restore(data, self.game_controller, self.creator).ticks
+        if isinstance(self.clock, FixedClock):
+            self.clock.ticks = self.ticks
+
+    def run(self, max_ticks = None):
+        """ Step until the seal gets eaten or max_ticks have run """
+        while not self.done() and (max_ticks is None or self.ticks < max_ticks):
+            self.step()
+        return self.result()
+
+    def result(self):
+        return {
+            "seed": self.seed,
+            "score": self.actor_controller.score,
+            "ticks": self.ticks,
+            "survival_time": self.ticks * self.timestep,
+            "eaten": self.done(),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a headless game")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-ticks", type=int, default=None)
+    parser.add_argument("--tick-rate", type=int, default=Simulation.TICK_RATE)
+    parser.add_argument("--press-probability", type=float, default=0.45)
+    args = parser.parse_args()
+
+    simulation = Simulation(args.seed,
+            RandomPolicy(args.seed, args.press_probability),
+            tick_rate = args.tick_rate)
+    start = time.perf_counter()
+    result = simulation.run(args.max_ticks)
+    elapsed = time.perf_counter() - start
+
+    for key, value in result.items():
+        print(key + ": " + str(value))
+    print("ticks per second: " + str(int(result["ticks"] / max(elapsed, 1e-9))))
+
+
+if __name__ == "__main__":
+    main()
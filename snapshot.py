@@ -0,0 +1,357 @@
+#!/bin/env python3
+"""
+Snapshots of a running game in a compact binary format.
+
+capture() packs everything a game needs to carry on from the current tick
+into a few kilobytes: the seal, every npc including ones that spawned but
+weren't placed yet, the queued events, score and mode, the chomp animation,
+the spawn queue and the state of the game's rng. restore() puts a snapshot
+back into a game that was set up the same way, e.g. by main.setup() or
+simulation.Simulation. Restoring a snapshot and running the same inputs
+again gives the exact same game, so snapshots are good for rollback,
+branching simulations off a checkpoint and crash dumps.
+
+    python snapshot.py --seed 1 --ticks 1500
+
+Audio isn't part of the game state, nor is anything the input comes from.
+
+Format, little endian:
+
+    header     4s magic, B version, B flags, B mode, x, q ticks, i score,
+               I npcs
+    seal       8d position, previous position, velocity, acceleration,
+               B animation active, B image index or NO_IMAGE, d elapsed
+    npcs       B kind per npc, then 4d x, y, previous x, x velocity per npc
+    events     H keys, then per key B name length, name, I queued events
+    spawner    q ticks, q sequence, B kinds, I dropped per kind,
+               H queued spawns, then per spawn q due, b priority,
+               q sequence, B kind
+    rng        B version, 625I state, B has gauss, d gauss
+    governor   i cap, d frame time, q frames, if FLAG_GOVERNOR
+
+With FLAG_ZLIB everything after the header is zlib compressed.
+
+"""
+
+import argparse
+import array
+import collections
+import struct
+import sys
+import time
+import zlib
+
+import actor
+import events
+import geometry
+
+MAGIC = b"SNAP"
+VERSION = 1
+FLAG_ZLIB = 1
+FLAG_GOVERNOR = 2
+
+HEADER = struct.Struct("<4sBBBxqiI")
+SEAL = struct.Struct("<8dBBd")
+COUNT = struct.Struct("<H")
+EVENT = struct.Struct("<I")
+SPAWNER = struct.Struct("<qqB")
+SPAWN = struct.Struct("<qbqB")
+RNG_STATE_SIZE = 625
+GAUSS = struct.Struct("<Bd")
+GOVERNOR = struct.Struct("<idq")
+
+# Image index of the seal when it isn't chomping
+NO_IMAGE = 255
+# Npc kinds, PENDING npcs are still queued on a new_fish/new_shark event
+SHARK = 1
+PENDING = 2
+NPC_VALUES = 4
+NPC_EVENTS = ("new_fish", "new_shark")
+
+Snapshot = collections.namedtuple("Snapshot", "ticks score mode npcs")
+
+
+def _little_endian(values):
+    """ array.array uses the machine's byte order, the format doesn't """
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def capture(game_controller, creator, ticks = 0, compress = False):
+    """
+    Pack the state of a game into bytes. creator is the game's NpcCreator
+    and ticks any tick counter of the caller's that should come back out
+    of restore().
+
+    """
+    actor_controller = game_controller.actor_controller
+    seal = actor_controller.player
+    seal_actor = seal.actor
+    state = seal_actor.state
+    chomp = seal.chomp
+    if seal.image in chomp.image_list:
+        image_index = chomp.image_list.index(seal.image)
+    else:
+        image_index = NO_IMAGE
+
+    # Placed npcs in group order, then the ones still waiting to be placed
+    kinds = bytearray()
+    values = array.array("d")
+    for kind, group in ((0, actor_controller.fish_sprite_group),
+            (SHARK, actor_controller.shark_sprite_group)):
+        kinds.extend(bytes((kind,)) * len(group))
+        for sprite in group:
+            npc = sprite.actor
+            values.extend((npc.state.position.x, npc.state.position.y,
+                npc.previous_position.x, npc.state.velocity.x))
+
+    events_manager = actor_controller.events
+    other_events = []
+    for key in list(events_manager.events):
+        queued = events_manager.peek(key)
+        if not queued:
+            continue
+        if key in NPC_EVENTS:
+            kind = NPC_EVENTS.index(key) | PENDING
+            for event in queued:
+                npc = event.value.actor
+                kinds.append(kind)
+                values.extend((npc.state.position.x, npc.state.position.y,
+                    npc.previous_position.x, npc.state.velocity.x))
+        elif any(getattr(x, "value", None) is not None for x in queued):
+            raise ValueError("Can't snapshot events with values for " + str(key))
+        else:
+            other_events.append((key.encode(), len(queued)))
+
+    scheduler = creator.scheduler
+    kind_names = list(scheduler.intervals)
+    flags = 0
+    if scheduler.governor is not None:
+        flags |= FLAG_GOVERNOR
+
+    body = [
+        SEAL.pack(state.position.x, state.position.y,
+            seal_actor.previous_position.x, seal_actor.previous_position.y,
+            state.velocity.x, state.velocity.y,
+            state.acceleration.x, state.acceleration.y,
+            chomp.active, image_index, chomp.elapsed),
+        bytes(kinds),
+        _little_endian(values).tobytes(),
+        COUNT.pack(len(other_events)),
+    ]
+    for name, count in other_events:
+        body.append(bytes((len(name),)) + name + EVENT.pack(count))
+
+    body.append(SPAWNER.pack(scheduler.ticks, scheduler._sequence, len(kind_names)))
+    body.append(_little_endian(array.array("I",
+        (scheduler.dropped[x] for x in kind_names))).tobytes())
+    body.append(COUNT.pack(len(scheduler.queue)))
+    body.extend(SPAWN.pack(due, priority, sequence, kind_names.index(kind))
+            for due, priority, sequence, kind in scheduler.queue)
+
+    rng_version, rng_state, gauss = creator.rng.getstate()
+    body.append(bytes((rng_version,)))
+    body.append(_little_endian(array.array("I", rng_state)).tobytes())
+    body.append(GAUSS.pack(gauss is not None, gauss or 0.0))
+
+    if flags & FLAG_GOVERNOR:
+        governor = scheduler.governor
+        body.append(GOVERNOR.pack(governor.cap, governor.frame_ms, governor.frames))
+
+    body = b"".join(body)
+    if compress:
+        flags |= FLAG_ZLIB
+        body = zlib.compress(body, 1)
+    header = HEADER.pack(MAGIC, VERSION, flags,
+            game_controller.MODE.index(game_controller.mode), ticks,
+            actor_controller.score, len(kinds))
+    return header + body
+
+
+class Reader:
+    """ Reads the packed sections of a snapshot in order """
+    def __init__(self, data, offset = 0):
+        self.data = memoryview(data)
+        self.offset = offset
+
+    def unpack(self, packer):
+        values = packer.unpack_from(self.data, self.offset)
+        self.offset += packer.size
+        return values
+
+    def bytes(self, size):
+        start = self.offset
+        self.offset += size
+        return self.data[start:self.offset]
+
+    def array(self, typecode, count):
+        values = array.array(typecode)
+        values.frombytes(self.bytes(count * values.itemsize))
+        return _little_endian(values)
+
+
+def read_header(data):
+    """ Snapshot tuple of the header, raises ValueError if it isn't a snapshot """
+    magic, version, flags, mode, ticks, score, npcs = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a game snapshot")
+    if version != VERSION:
+        raise ValueError("Unsupported snapshot version " + str(version))
+    return Snapshot(ticks, score, mode, npcs), flags
+
+
+def restore(data, game_controller, creator):
+    """
+    Put a snapshot back into a game, replacing its state. The game must
+    have been set up like the one the snapshot was taken from. Returns the
+    Snapshot tuple of the header.
+
+    """
+    header, flags = read_header(data)
+    if flags & FLAG_ZLIB:
+        reader = Reader(zlib.decompress(memoryview(data)[HEADER.size:]))
+    else:
+        reader = Reader(data, HEADER.size)
+
+    actor_controller = game_controller.actor_controller
+    events_manager = actor_controller.events
+    actor_controller.clear_npcs()
+    events_manager.clear()
+
+    game_controller.mode = game_controller.MODE[header.mode]
+    game_controller.do_reset = False
+    game_controller.full_redraw = True
+    actor_controller.score = header.score
+
+    seal_values = reader.unpack(SEAL)
+    seal = actor_controller.player
+    seal_actor = seal.actor
+    state = seal_actor.state
+    state.position.set(*seal_values[0:2])
+    seal_actor.previous_position.set(*seal_values[2:4])
+    state.velocity.set(*seal_values[4:6])
+    state.acceleration.set(*seal_values[6:8])
+    seal.rect.topleft = state.position.to_tuple()
+    seal.chomp.active = bool(seal_values[8])
+    seal.chomp.elapsed = seal_values[10]
+    image_index = seal_values[9]
+    seal.set_image(seal.main_image if image_index == NO_IMAGE else
+            seal.chomp.image_list[image_index])
+
+    kinds = reader.bytes(header.npcs)
+    values = reader.array("d", header.npcs * NPC_VALUES)
+    for i, kind in enumerate(kinds):
+        x, y, previous_x, velocity_x = values[i * NPC_VALUES:(i + 1) * NPC_VALUES]
+        shark = bool(kind & SHARK)
+        loader = creator.shark_loader if shark else creator.fish_loader
+        sprite = loader.new_sprite()
+        size = geometry.Vector(*sprite.rect.size)
+        npc = sprite.actor
+        if npc is None:
+            npc = (actor.NpcShark if shark else actor.NpcFish)(geometry.State(), size)
+        else:
+            npc.reset()
+            npc.size = size
+        npc.state.position.set(x, y)
+        npc.state.velocity.x = velocity_x
+        sprite.set_actor(npc)
+        sprite.events = events_manager
+
+        if kind & PENDING:
+            npc_event = events.NewSharkEvent(sprite) if shark else events.NewFishEvent(sprite)
+            events_manager.queue(npc_event.key, npc_event)
+            continue
+        actor_controller.place_npc(sprite, actor_controller.npc_bounds)
+        npc.previous_position.x = previous_x
+        actor_controller.add_npc(sprite, shark)
+
+    for i in range(reader.unpack(COUNT)[0]):
+        key = bytes(reader.bytes(reader.bytes(1)[0])).decode()
+        for j in range(reader.unpack(EVENT)[0]):
+            events_manager.queue(key, events.GameEvent(key))
+
+    scheduler = creator.scheduler
+    kind_names = list(scheduler.intervals)
+    scheduler.ticks, scheduler._sequence, kind_count = reader.unpack(SPAWNER)
+    if kind_count != len(kind_names):
+        raise ValueError("The snapshot has %d spawn kinds, the game %d" %
+                (kind_count, len(kind_names)))
+    for name, dropped in zip(kind_names, reader.array("I", kind_count)):
+        scheduler.dropped[name] = dropped
+    scheduler.queue = [(due, priority, sequence, kind_names[kind]) for due,
+            priority, sequence, kind in (reader.unpack(SPAWN)
+                for i in range(reader.unpack(COUNT)[0]))]
+
+    rng_version = reader.bytes(1)[0]
+    rng_state = tuple(reader.array("I", RNG_STATE_SIZE))
+    has_gauss, gauss = reader.unpack(GAUSS)
+    creator.rng.setstate((rng_version, rng_state, gauss if has_gauss else None))
+
+    if flags & FLAG_GOVERNOR:
+        cap, frame_ms, frames = reader.unpack(GOVERNOR)
+        if scheduler.governor is not None:
+            scheduler.governor.cap = cap
+            scheduler.governor.frame_ms = frame_ms
+            scheduler.governor.frames = frames
+    return header
+
+
+def save(path, data):
+    """ Write a snapshot to a file, e.g. as a crash dump """
+    with open(path, "wb") as snapshot_file:
+        snapshot_file.write(data)
+
+
+def load(path):
+    with open(path, "rb") as snapshot_file:
+        data = snapshot_file.read()
+    read_header(data)
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure snapshot size and speed")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--ticks", type=int, default=1500,
+            help="Ticks to run before taking the snapshot")
+    parser.add_argument("--branch-ticks", type=int, default=600,
+            help="Ticks to run after restoring, to check the game carries on the same")
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+
+    # Only needed for measuring
+    import replay
+    import simulation
+
+    game = simulation.Simulation(args.seed, simulation.PeriodicPolicy())
+    game.run(args.ticks)
+    npc_count = game.actor_controller.npc_count
+    data = game.snapshot()
+    compressed = game.snapshot(compress = True)
+
+    start = time.perf_counter()
+    for i in range(args.repeat):
+        game.snapshot()
+    capture_time = (time.perf_counter() - start) / args.repeat
+    start = time.perf_counter()
+    for i in range(args.repeat):
+        game.restore(data)
+    restore_time = (time.perf_counter() - start) / args.repeat
+
+    # Run on from the snapshot twice, once in a fresh game of another seed
+    checksums = []
+    for branch in (game, simulation.Simulation(args.seed + 1, simulation.PeriodicPolicy())):
+        branch.restore(data)
+        branch.run(args.ticks + args.branch_ticks)
+        checksums.append(replay.state_checksum(branch.game_controller))
+
+    print("%d npcs at tick %d" % (npc_count, args.ticks))
+    print("%d bytes, %d compressed" % (len(data), len(compressed)))
+    print("capture %.1fus, restore %.1fus" % (capture_time * 1e6, restore_time * 1e6))
+    print("branches match" if checksums[0] == checksums[1] else "branches differ")
+    return 0 if checksums[0] == checksums[1] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,146 @@
+#!/bin/env python3
+"""
+Sound effects and music for every game in the process.
+
+Sound effects are decoded once into a bank that every game shares. Each
+category of sound effect in the asset list gets its own reserved mixer
+channels, see config.AudioInfo. A burst of chomps can then only cut off
+older chomps, never the shark hit. Sounds that are started again right
+after they last did are dropped. Music isn't decoded into a Sound at all,
+it's streamed from disk through pygame.mixer.music.
+
+Without an initialized mixer everything here is silent.
+
+"""
+
+import time
+
+import pygame
+
+import config
+import game_assets
+
+
+class SoundManager:
+    def __init__(self, channels = None, min_interval_ms = None, clock = time.perf_counter):
+        audio = config.AudioInfo
+        # category -> number of reserved channels
+        self.channel_counts = dict(channels if channels is not None else audio.channels)
+        self.min_interval = {key: value / 1e3 for key, value in
+                (min_interval_ms if min_interval_ms is not None else
+                    audio.min_interval_ms).items()}
+        self.clock = clock
+
+        # name -> pygame.mixer.Sound or game_assets.PendingSound
+        self.bank = dict()
+        self.categories = dict()
+        # name -> path of music, streamed when it plays
+        self.music_paths = dict()
+        self.music = None
+
+        # category -> mixer channels and when each started its last sound,
+        # set up the first time something plays
+        self.channels = None
+        self.started = dict()
+        self.last_played = dict()
+
+        self.played = 0
+        self.stolen = 0
+        self.limited = 0
+
+    @staticmethod
+    def available():
+        return pygame.mixer.get_init() is not None
+
+    def load(self, service = None):
+        """
+        Put every sound of the asset list that isn't in the bank yet into
+        it. With a game_assets.LoaderService they decode in the background
+        and stay silent until they are ready.
+
+        """
+        manifest = game_assets.AssetManager.get_manifest()
+        for name, asset_object in manifest.items():
+            if "ogg" not in asset_object or name in self.categories:
+                continue
+            if asset_object.get("music", False):
+                self.music_paths[name] = game_assets.AudioLoader.ogg_path(asset_object)
+                continue
+            if not self.available():
+                continue
+            self.categories[name] = asset_object.get("category")
+            self.bank[name] = game_assets.AudioLoader(name, service).audio
+
+    def reserve_channels(self):
+        """ Set aside the channels of each category, once the mixer is up """
+        reserved = sum(self.channel_counts.values())
+        pygame.mixer.set_num_channels(max(pygame.mixer.get_num_channels(),
+            reserved + config.AudioInfo.free_channels))
+        # Sounds that play without a channel of their own skip these
+        pygame.mixer.set_reserved(reserved)
+
+        self.channels = dict()
+        first = 0
+        for category, count in self.channel_counts.items():
+            self.channels[category] = [pygame.mixer.Channel(first + i) for i in range(count)]
+            self.started[category] = [0.0] * count
+            first += count
+
+    def play(self, name, loops = 0):
+        """ Play a sound effect, returns the channel or None if it didn't play """
+        sound = self.bank.get(name)
+        if sound is None:
+            return None
+        if isinstance(sound, game_assets.PendingSound):
+            if sound.resolve() is None:
+                return None
+            sound = self.bank[name] = sound.sound
+
+        category = self.categories[name]
+        now = self.clock()
+        last = self.last_played.get(name)
+        if last is not None and now - last < self.min_interval.get(category, 0.0):
+            self.limited += 1
+            return None
+        self.last_played[name] = now
+        self.played += 1
+
+        if self.channels is None:
+            self.reserve_channels()
+        channels = self.channels.get(category)
+        if channels is None:
+            return sound.play(loops)
+
+        started = self.started[category]
+        for i, channel in enumerate(channels):
+            if not channel.get_busy():
+                break
+        else:
+            # Every channel is busy, cut off the oldest sound
+            i = started.index(min(started))
+            channel = channels[i]
+            self.stolen += 1
+        channel.play(sound, loops)
+        started[i] = now
+        return channel
+
+    def play_music(self, name, loops = -1):
+        path = self.music_paths.get(name)
+        if path is None or not self.available():
+            return
+        if self.music != name:
+            pygame.mixer.music.load(path)
+            self.music = name
+        pygame.mixer.music.play(loops)
+
+    def fadeout_music(self, time):
+        if self.available():
+            pygame.mixer.music.fadeout(time)
+
+    def stats(self):
+        return {"played": self.played, "stolen": self.stolen,
+                "limited": self.limited, "sounds": len(self.bank)}
+
+
+# The sounds of this process, shared by every game in it
+manager = SoundManager()
@@ -0,0 +1,125 @@
+#!/bin/env python3
+"""
+Tick based npc spawn scheduling.
+
+Upcoming spawns sit in a priority queue ordered by the tick they are due
+on, so no OS timers or event queue are involved and a seeded game always
+spawns the same npcs on the same ticks. How often npcs spawn and how many
+come at once follow curves over the score, see config.Difficulty. An
+optional SpawnGovernor caps the number of live npcs while frames run over
+budget.
+
+"""
+
+import heapq
+
+import config
+
+
+def spawn_rate(score):
+    """ Spawn rate multiplier at score, 1 is the base rate """
+    difficulty = config.Difficulty
+    return min(difficulty.spawn_rate_max, 1.0 + difficulty.spawn_rate_growth * score)
+
+
+def batch_size(score):
+    """ Npcs spawned at once at score """
+    step = int(config.Difficulty.batch_score_step)
+    if step <= 0:
+        return 1
+    return min(int(config.Difficulty.max_batch), 1 + score // step)
+
+
+class SpawnScheduler:
+    """
+    Priority queue of (due tick, priority, sequence, kind) entries.
+
+    Each kind spawns every interval_ms at the base rate. When an entry comes
+    due it's replaced with the next one for its kind, spaced by the interval
+    at the current score. Kinds due on the same tick come out in priority
+    order.
+
+    """
+    def __init__(self, tick_rate = 120, governor = None):
+        self.tick_rate = tick_rate
+        self.governor = governor
+        self.ticks = 0
+        self.queue = []
+        self.intervals = dict()
+        self.priorities = dict()
+        self._sequence = 0
+        # Spawns the governor dropped, per kind
+        self.dropped = dict()
+
+    def add_kind(self, kind, interval_ms, priority = 0):
+        """ Start spawning kind, the first one comes after one interval """
+        self.intervals[kind] = interval_ms
+        self.priorities[kind] = priority
+        self.dropped[kind] = 0
+        self.schedule(kind, self.interval_ticks(kind, 0))
+
+    def interval_ticks(self, kind, score):
+        return max(1, round(self.intervals[kind] * self.tick_rate / 1e3 / spawn_rate(score)))
+
+    def schedule(self, kind, due):
+        heapq.heappush(self.queue, (due, self.priorities[kind], self._sequence, kind))
+        self._sequence += 1
+
+    def next_due(self):
+        """ Tick of the next spawn, None if nothing is scheduled """
+        return self.queue[0][0] if self.queue else None
+
+    def tick(self, score = 0, npc_count = 0):
+        """ Advance one tick, returns a list of (kind, count) to spawn now """
+        self.ticks += 1
+        spawns = []
+        queue = self.queue
+        while queue and queue[0][0] <= self.ticks:
+            due, priority, sequence, kind = heapq.heappop(queue)
+            self.schedule(kind, due + self.interval_ticks(kind, score))
+
+            count = batch_size(score)
+            if self.governor is not None:
+                allowed = max(0, self.governor.cap - npc_count)
+                self.dropped[kind] += max(0, count - allowed)
+                count = min(count, allowed)
+            if count:
+                spawns.append((kind, count))
+                npc_count += count
+        return spawns
+
+
+class SpawnGovernor:
+    """
+    Caps the number of live npcs so frame time stays within budget.
+
+    Feed it the time each frame took, without the frame rate delay. While
+    the smoothed frame time is over budget the cap drops a little below the
+    current npc count, once there's headroom again it creeps back up. Frame
+    times depend on the machine, so games that must replay exactly shouldn't
+    use one.
+
+    """
+    # Weight of the newest frame in the smoothed frame time
+    SMOOTHING = 0.1
+    # Frames between cap adjustments
+    ADJUST_EVERY = 30
+
+    def __init__(self, budget_ms = None, min_npcs = None, max_npcs = None):
+        engine = config.EngineInfo
+        self.budget_ms = budget_ms if budget_ms is not None else engine.frame_budget_ms
+        self.min_npcs = min_npcs if min_npcs is not None else engine.min_npcs
+        self.max_npcs = max_npcs if max_npcs is not None else engine.max_npcs
+        self.cap = self.max_npcs
+        self.frame_ms = 0.0
+        self.frames = 0
+
+    def observe(self, frame_ms, npc_count):
+        self.frame_ms += (frame_ms - self.frame_ms) * self.SMOOTHING
+        self.frames += 1
+        if self.frames % self.ADJUST_EVERY:
+            return
+        if self.frame_ms > self.budget_ms:
+            self.cap = max(self.min_npcs, min(self.cap, int(npc_count * 0.9)))
+        elif self.frame_ms < self.budget_ms * 0.7:
+            self.cap = min(self.max_npcs, self.cap + max(1, self.cap // 10))
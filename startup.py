@@ -0,0 +1,73 @@
+#!/bin/env python3
+"""
+Timeline of what happens between starting the game and being able to play.
+
+main.py records a span for every import, pygame subsystem and asset it
+loads, so that python main.py --profile-startup can show where the time to
+the first frame goes, and how long the assets take to load behind the start
+screen after that.
+
+"""
+
+import contextlib
+import threading
+import time
+
+
+class StartupTimeline:
+    def __init__(self):
+        self.start = time.perf_counter()
+        # (category, name, start, duration, on the main thread), in seconds
+        # since self.start. Spans may be added from any thread.
+        self.spans = []
+        self.first_frame_time = None
+        self.ready_time = None
+
+    def now(self):
+        return time.perf_counter() - self.start
+
+    @contextlib.contextmanager
+    def span(self, category, name):
+        begin = self.now()
+        try:
+            yield
+        finally:
+            self.spans.append((category, name, begin, self.now() - begin,
+                threading.current_thread() is threading.main_thread()))
+
+    def first_frame(self):
+        """ Call once the first frame is on screen """
+        if self.first_frame_time is None:
+            self.first_frame_time = self.now()
+
+    def ready(self):
+        """ Call once everything needed to play is loaded """
+        if self.ready_time is None:
+            self.ready_time = self.now()
+
+    def report(self):
+        first_frame = self.first_frame_time if self.first_frame_time is not None else self.now()
+        main_spans = [x for x in self.spans if x[4]]
+        before = [x for x in main_spans if x[2] < first_frame]
+        after = [x for x in main_spans if x[2] >= first_frame]
+        # These overlap with the main thread, so they don't add up with it
+        threaded = sorted((x for x in self.spans if not x[4]), key=lambda x: x[2])
+
+        lines = ["Startup, in ms since the first import:", "  before the first frame"]
+        lines.extend("    %-8s %-24s %8.1f" % (x[0], x[1], x[3] * 1e3) for x in before)
+        lines.append("    %-33s %8.1f" % ("other", (first_frame - sum(x[3] for x in before)) * 1e3))
+        lines.append("  %-35s %8.1f" % ("first frame", first_frame * 1e3))
+        if after:
+            lines.append("  after the first frame")
+            lines.extend("    %-8s %-24s %8.1f" % (x[0], x[1], x[3] * 1e3) for x in after)
+        if self.ready_time is not None:
+            lines.append("  %-35s %8.1f" % ("ready to play", self.ready_time * 1e3))
+        if threaded:
+            lines.append("  on other threads, from start to end")
+            lines.extend("    %-8s %-24s %8.1f %8.1f" % (x[0], x[1], x[2] * 1e3,
+                (x[2] + x[3]) * 1e3) for x in threaded)
+        return "\n".join(lines)
+
+
+# The timeline of this process, it starts when this module is first imported
+timeline = StartupTimeline()
@@ -0,0 +1,85 @@
+#!/bin/env python3
+"""
+Caches for rendered text.
+
+Most text in the game never changes, and the score only changes when a fish
+gets eaten, so there's no reason to rasterize it again every frame. The
+surfaces handed out are shared, don't draw on them.
+
+"""
+
+import collections
+
+import config
+
+
+class TextCache:
+    """ LRU cache of rendered text keyed on (string, color, antialias) """
+    def __init__(self, font, max_entries = 64):
+        self.font = font
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, string, antialias, color):
+        """ Same arguments as pygame.font.Font.render """
+        key = (string, tuple(color), antialias)
+        surface = self.entries.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = self.font.render(string, antialias, color)
+        self.entries[key] = surface
+        if len(self.entries) > self.max_entries:
+            # Drop the least recently used
+            self.entries.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.entries.clear()
+
+
+class NumberText:
+    """
+    Draws a fixed prefix followed by a number.
+
+    The prefix and the glyphs for 0-9 are rendered once, after that drawing
+    a number is just a few blits.
+
+    """
+    def __init__(self, font, prefix, color, antialias = True):
+        self.prefix = font.render(prefix, antialias, color)
+        self.digits = [font.render(str(x), antialias, color) for x in range(10)]
+        self.height = max([self.prefix.get_height()] +
+                [x.get_height() for x in self.digits])
+
+    def get_rect(self, number):
+        width = self.prefix.get_width()
+        for digit in str(number):
+            width += self.digits[ord(digit) - 48].get_width()
+        return self.prefix.get_rect(width = width, height = self.height)
+
+    def draw(self, screen, number, rect):
+        """ Draw the number into a rect from get_rect(), returns the rect """
+        screen.blit(self.prefix, rect.topleft)
+        x = rect.x + self.prefix.get_width()
+        for digit in str(number):
+            glyph = self.digits[ord(digit) - 48]
+            screen.blit(glyph, (x, rect.y))
+            x += glyph.get_width()
+        return rect
+
+
+_default_cache = None
+
+def render(string, antialias, color):
+    """ Like config.ScreenInfo.font.render, but through a shared cache """
+    global _default_cache
+    font = config.ScreenInfo.font
+    if _default_cache is None or _default_cache.font is not font:
+        _default_cache = TextCache(font)
+    return _default_cache.render(string, antialias, color)